@@ -0,0 +1,53 @@
+#============================================================================#
+#                         Import Time Benchmark                              #
+#============================================================================#
+'''
+Time importing the HEPGen modules in fresh interpreters and fail if any of
+them is slower than its budget. Each module is imported several times and
+the fastest import is compared, to reduce noise from the machine.
+
+    python benchmarks/import_time.py [--repeat N] [--scale FACTOR]
+'''
+
+import argparse
+import subprocess
+import sys
+
+_budgets = {'hepgen'          : 0.05, #seconds
+            'hepgen.particle' : 0.10,
+            'hepgen.decays'   : 0.10,
+            'hepgen.data_tree': 0.30,
+            'hepgen.gen_data' : 0.40}
+
+_snippet = '''
+import time
+_t = time.perf_counter()
+import {}
+print(time.perf_counter()-_t)
+'''
+
+def time_import(module, repeat=5):
+    '''Return the fastest time in seconds taken to import a module in a new interpreter'''
+    _times = []
+    for i in range(repeat):
+        _out = subprocess.check_output([sys.executable, '-c', _snippet.format(module)])
+        _times.append(float(_out.decode().split()[-1]))
+    return min(_times)
+
+def main(argv=None):
+    _parser = argparse.ArgumentParser(description='HEPGen import time benchmark')
+    _parser.add_argument('--repeat', type=int, default=5, help='Imports per module')
+    _parser.add_argument('--scale', type=float, default=1., help='Multiply all budgets by this factor')
+    _args = _parser.parse_args(argv)
+
+    _failed = False
+    for module, budget in _budgets.items():
+        _time = time_import(module, _args.repeat)
+        _ok = _time <= budget*_args.scale
+        _failed |= not _ok
+        print('{:<20} {:8.1f} ms   budget {:8.1f} ms   {}'.format(module, _time*1E3, budget*_args.scale*1E3,
+                                                                 'OK' if _ok else 'TOO SLOW'))
+    return 1 if _failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+#============================================================================#
+#                           HEPGen Benchmark Suite                           #
+#============================================================================#
+'''
+Reproducible timings of event generation, Data Tree filling and reading, and
+particle/decay table loading. Every case runs in a fresh interpreter so the
+reported peak RSS belongs to that case alone.
+
+    python benchmarks/suite.py                      # run all cases
+    python benchmarks/suite.py --filter gen_batch   # cases containing a string
+    python benchmarks/suite.py --json new.json      # save results
+    python benchmarks/suite.py --compare old.json   # fail on >20% slowdowns
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_decays = ['SK020002', 'SK020001', 'SB040006'] #k+_pipipi, k+_pi+mu+mu-, bc+_phik+
+_seed = 12345
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/(1E6 if sys.platform == 'darwin' else 1E3)
+
+def _quiet():
+    import logging
+    logging.disable(logging.INFO)
+
+#---------------------------------- Cases -----------------------------------#
+
+def bench_generate(decay, nevts, energy, **kwargs):
+    _quiet()
+    from hepgen.gen_data import HEPGen
+    _gen = HEPGen(decay, nevts=nevts, energy=energy, seed=_seed, **kwargs)
+    _start = time.perf_counter()
+    _gen()
+    return time.perf_counter()-_start, nevts
+
+def bench_write(decay, nevts, compression=None):
+    _quiet()
+    import tempfile
+    from hepgen.gen_data import HEPGen
+    _gen = HEPGen(decay, nevts=nevts, energy=10000, seed=_seed, batch_size=100000)
+    with tempfile.TemporaryDirectory() as tmp:
+        _start = time.perf_counter()
+        _gen.write(os.path.join(tmp, 'bench.hgt'), compression=compression)
+        return time.perf_counter()-_start, nevts
+
+def bench_tree_fill(nevts, nbranches=63):
+    from hepgen.data_tree import data_tree
+    _tree = data_tree('bench', ['b{}'.format(i) for i in range(nbranches)])
+    _row = [float(i) for i in range(nbranches)]
+    _start = time.perf_counter()
+    for i in range(nevts):
+        _tree.fill(_row)
+    return time.perf_counter()-_start, nevts
+
+def bench_tree_fill_branch(nevts, nbranches=63):
+    from hepgen.data_tree import data_tree
+    _branches = ['b{}'.format(i) for i in range(nbranches)]
+    _tree = data_tree('bench', _branches)
+    _start = time.perf_counter()
+    for i in range(nevts):
+        for b in _branches:
+            _tree._fill_branch(b, 1.)
+    return time.perf_counter()-_start, nevts
+
+def bench_tree_get_entry(nevts, nbranches=63):
+    import numpy as np
+    from hepgen.data_tree import data_tree
+    _tree = data_tree('bench')
+    for i in range(nbranches):
+        _tree.add_branch('b{}'.format(i), np.arange(nevts, dtype=float))
+    _start = time.perf_counter()
+    for i in range(nevts):
+        _tree.getEntry(i)
+    return time.perf_counter()-_start, nevts
+
+def bench_tree_concat(nevts, nparts=1000, nbranches=63):
+    import numpy as np
+    from hepgen.data_tree import data_tree
+    _tree = data_tree('bench')
+    for i in range(nbranches):
+        _tree.add_branch('b{}'.format(i), np.arange(nevts, dtype=float))
+    _parts = _tree.shard(nparts)
+    _start = time.perf_counter()
+    data_tree.concat(_parts)
+    return time.perf_counter()-_start, nevts
+
+def bench_import(module):
+    _start = time.perf_counter()
+    __import__(module)
+    return time.perf_counter()-_start, 1
+
+def bench_table(table):
+    _start = time.perf_counter()
+    if table == 'pdg':
+        from hepgen import particle
+        particle.pdg
+    else:
+        from hepgen import decays
+        decays.decay_table
+    return time.perf_counter()-_start, 1
+
+def cases(quick=False):
+    '''All benchmark cases as (name, function name, keyword arguments)'''
+    _cases = []
+    _sizes = [10000] if quick else [10000, 1000000]
+    for decay in _decays:
+        for energy in [0, 10000]:
+            _cases.append(('gen_scalar_{}_E{}_N1000'.format(decay, energy), 'bench_generate',
+                           {'decay' : decay, 'nevts' : 1000, 'energy' : energy}))
+            for nevts in _sizes:
+                _cases.append(('gen_batch_{}_E{}_N{}'.format(decay, energy, nevts), 'bench_generate',
+                               {'decay' : decay, 'nevts' : nevts, 'energy' : energy, 'batch_size' : 100000}))
+                _cases.append(('gen_primary_{}_E{}_N{}'.format(decay, energy, nevts), 'bench_generate',
+                               {'decay' : decay, 'nevts' : nevts, 'energy' : energy, 'batch_size' : 100000,
+                                'primary_only' : True}))
+                _cases.append(('gen_phase_space_{}_E{}_N{}'.format(decay, energy, nevts), 'bench_generate',
+                               {'decay' : decay, 'nevts' : nevts, 'energy' : energy, 'batch_size' : 100000,
+                                'mode' : 'phase_space'}))
+    _n = 10000 if quick else 100000
+    for compression in [None, 'zlib']:
+        _cases.append(('write_{}_{}_N{}'.format(_decays[0], compression or 'raw', _sizes[-1]), 'bench_write',
+                       {'decay' : _decays[0], 'nevts' : _sizes[-1], 'compression' : compression}))
+    _cases += [('tree_fill_N{}'.format(_n), 'bench_tree_fill', {'nevts' : _n}),
+               ('tree_fill_branch_N{}'.format(_n), 'bench_tree_fill_branch', {'nevts' : _n}),
+               ('tree_get_entry_N{}'.format(_n), 'bench_tree_get_entry', {'nevts' : _n}),
+               ('tree_concat_N{}'.format(_n), 'bench_tree_concat', {'nevts' : _n})]
+    for module in ['hepgen.particle', 'hepgen.decays']:
+        _cases.append(('import_{}'.format(module), 'bench_import', {'module' : module}))
+    for table in ['pdg', 'decay_table']:
+        _cases.append(('build_{}'.format(table), 'bench_table', {'table' : table}))
+    return _cases
+
+#---------------------------------- Runner ----------------------------------#
+
+def run_case(function, kwargs, repeat):
+    '''Run a case in a new interpreter 'repeat' times and keep the fastest'''
+    _results = []
+    for i in range(repeat):
+        _proc = subprocess.run([sys.executable, __file__, '--run-case', function, json.dumps(kwargs)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if _proc.returncode != 0:
+            _stderr = _proc.stderr.decode().strip().splitlines() or ['exit code {}'.format(_proc.returncode)]
+            return {'error' : _stderr[-1]}
+        _results.append(json.loads(_proc.stdout.decode().splitlines()[-1]))
+    return min(_results, key=lambda r: r['time'])
+
+def _child(function, kwargs):
+    _time, _n = globals()[function](**json.loads(kwargs))
+    print(json.dumps({'time' : _time, 'per_sec' : _n/_time, 'max_rss_mb' : _max_rss_mb()}))
+
+def main(argv=None):
+    _parser = argparse.ArgumentParser(description='HEPGen benchmark suite')
+    _parser.add_argument('--filter', default='', help='Only run cases whose name contains this')
+    _parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the fastest is kept')
+    _parser.add_argument('--quick', action='store_true', help='Use smaller event counts')
+    _parser.add_argument('--json', help='Write results to this file')
+    _parser.add_argument('--compare', help='Results file to compare against')
+    _parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed fractional slowdown')
+    _parser.add_argument('--run-case', nargs=2, help=argparse.SUPPRESS)
+    _args = _parser.parse_args(argv)
+
+    if _args.run_case:
+        _child(*_args.run_case)
+        return 0
+
+    _baseline = {}
+    if _args.compare:
+        with open(_args.compare) as f:
+            _baseline = json.load(f)['results']
+
+    _results, _failed = {}, False
+    print('{:<40} {:>10} {:>14} {:>10}  {}'.format('case', 'time [s]', 'per sec', 'RSS [MB]', ''))
+    for name, function, kwargs in cases(_args.quick):
+        if _args.filter not in name:
+            continue
+        _result = run_case(function, kwargs, _args.repeat)
+        _results[name] = _result
+        if 'error' in _result:
+            #A case which no longer runs fails the suite as a regression does
+            print('{:<40} FAILED {}'.format(name, _result['error']))
+            _failed = True
+            continue
+        _note = ''
+        if name in _baseline and 'time' in _baseline[name]:
+            _ratio = _result['time']/_baseline[name]['time']
+            _note = '{:+.0%}'.format(_ratio-1)
+            if _ratio > 1+_args.tolerance:
+                _note += ' REGRESSION'
+                _failed = True
+        print('{:<40} {:10.4f} {:14.1f} {:10.1f}  {}'.format(name, _result['time'], _result['per_sec'],
+                                                           _result['max_rss_mb'] or 0, _note))
+
+    if _args.json:
+        with open(_args.json, 'w') as f:
+            json.dump({'python' : sys.version, 'platform' : sys.platform, 'results' : _results}, f, indent=2)
+
+    return 1 if _failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,14 @@
-from pkg_resources import get_distribution
-
 __project__ = 'HEPGen'
-__version__ = get_distribution(__project__).version
+
+def __getattr__(name):
+    #Look the version up on first use as the distribution metadata is slow to load
+    if name == '__version__':
+        global __version__
+        try:
+            from importlib.metadata import version
+        except ImportError:
+            from pkg_resources import get_distribution
+            version = lambda project: get_distribution(project).version
+        __version__ = version(__project__)
+        return __version__
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
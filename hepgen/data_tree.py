@@ -2,11 +2,416 @@
 #                             Data Tree Module                               #
 #============================================================================#
 
+from hepgen import expression
+from hepgen.histogram import Histogram
+import numpy as np
+import collections
+import contextlib
+import json
+import os
+import queue
+import struct
+import threading
+
+_magic = b'HEPGENDT'
+_format_version = 3 #Version 2 adds compressed branches, version 3 headers after the data
+_align = 64
+_append_buffer = 4096 #Values appended one at a time before they are copied into the column
+_trailer = struct.Struct('<Q8s') #Header length and magic closing a file whose header follows the data
+
+def _aligned(n):
+    return -(-n//_align)*_align
+
+def _branch_entries(branches):
+    '''Header entries of the branches, with the offset of each column from the start of the data'''
+    _entries, _offset = [], 0
+    for branch, dtype, length, *extra in branches:
+        _entry = {'name' : branch, 'dtype' : np.dtype(dtype).str, 'offset' : _offset, 'length' : length}
+        _entry.update(*extra)
+        _entries.append(_entry)
+        _offset = _aligned(_offset+_nbytes(_entry))
+    return _entries
+
+def _nbytes(entry):
+    return entry.get('nbytes', entry['length']*np.dtype(entry['dtype']).itemsize)
+
+def _header_bytes(name, entries, metadata):
+    return json.dumps({'version' : _format_version, 'name' : name,
+                       'entries' : entries[0]['length'] if entries else None,
+                       'branches' : entries, 'metadata' : metadata}).encode('utf-8')
+
+def _write_header(f, name, entries, metadata):
+    '''
+    Write the file header for the branch entries from '_branch_entries' and
+    return the offset at which the branch data starts. Columns are stored
+    contiguously in the given order, each aligned to 64 bytes.
+    '''
+    _header = _header_bytes(name, entries, metadata)
+    f.write(_magic+struct.pack('<Q', len(_header))+_header)
+    _start = _aligned(f.tell())
+    f.write(b'\0'*(_start-f.tell()))
+    return _start
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(_magic)) != _magic:
+            raise IOError("'{}' is not a Data Tree file".format(path))
+        _length, = struct.unpack('<Q', f.read(8))
+        if _length == 0:
+            #Written by a tree_writer, the header is at the end of the file
+            f.seek(-_trailer.size, os.SEEK_END)
+            _length, _end = _trailer.unpack(f.read(_trailer.size))
+            if _end != _magic:
+                raise IOError("Data Tree file '{}' is incomplete".format(path))
+            f.seek(-_trailer.size-_length, os.SEEK_END)
+            _start = _aligned(len(_magic)+8)
+        else:
+            _start = None
+        _header = json.loads(f.read(_length).decode('utf-8'))
+        if _header['version'] > _format_version:
+            raise IOError("'{}' needs a newer version of HEPGen to read".format(path))
+        return _header, _start if _start is not None else _aligned(f.tell())
+
+@contextlib.contextmanager
+def _replacing(path):
+    '''
+    Open a temporary file next to 'path' for writing and move it into place
+    once the block succeeds, so that 'path' is either left untouched or holds
+    a complete file. On an error the temporary file is removed instead.
+    '''
+    _temp = '{}.part'.format(path)
+    try:
+        with open(_temp, 'wb') as f:
+            yield f
+    except BaseException:
+        os.remove(_temp)
+        raise
+    os.replace(_temp, path)
+
+def _pad(f):
+    f.write(b'\0'*(_aligned(f.tell())-f.tell()))
+
+def _codec(name, level=None):
+    '''
+    Compression of branch blocks as (name, compress, decompress). 'lz4' and
+    'zstd' are used when their packages are installed and otherwise fall back
+    to zlib at a comparable speed setting, the codec actually used is the
+    one stored in the file.
+    '''
+    if name == 'lz4':
+        try:
+            import lz4.frame
+            return 'lz4', lambda b: lz4.frame.compress(b, level or 0), lz4.frame.decompress
+        except ImportError:
+            name, level = 'zlib', level or 1
+    if name == 'zstd':
+        try:
+            import zstandard
+            return ('zstd', zstandard.ZstdCompressor(level=level or 3).compress,
+                    lambda b: zstandard.ZstdDecompressor().decompress(b))
+        except ImportError:
+            name, level = 'zlib', level or 3
+    if name == 'zlib':
+        import zlib
+        return 'zlib', lambda b: zlib.compress(b, 1 if level is None else level), zlib.decompress
+    if name == 'lzma':
+        import lzma
+        return 'lzma', lambda b: lzma.compress(b, preset=6 if level is None else level), lzma.decompress
+    if name == 'bz2':
+        import bz2
+        return 'bz2', lambda b: bz2.compress(b, level or 9), bz2.decompress
+    raise ValueError("Unknown compression '{}', use one of zlib, lzma, bz2, lz4 or zstd".format(name))
+
+def _shuffle(values):
+    #Group the n-th bytes of all values together, which compresses floats better and faster
+    return np.ascontiguousarray(values).view(np.uint8).reshape(-1, values.dtype.itemsize).T.tobytes()
+
+def _unshuffle(data, dtype):
+    return np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1).T.copy().view(dtype).ravel()
+
+def _branch_blocks(entry):
+    '''
+    Blocks of a branch stored in blocks as [offset, nbytes, values] with the
+    offset from the start of the data. Blocks given as [nbytes, values] follow
+    each other from the offset of the branch.
+    '''
+    _blocks, _offset = [], entry['offset']
+    for block in entry['blocks']:
+        if len(block) == 3:
+            _blocks.append(block)
+        else:
+            _blocks.append([_offset]+list(block))
+            _offset += block[0]
+    return _blocks
+
+def _read_blocks(path, start, entry):
+    '''Read, and decompress if needed, all blocks of a branch'''
+    _dtype = np.dtype(entry['dtype'])
+    _decompress = _codec(entry['compression'])[2] if entry.get('compression') else None
+    _data = np.empty(entry['length'], dtype=_dtype)
+    _i = 0
+    with open(path, 'rb') as f:
+        for offset, nbytes, n in _branch_blocks(entry):
+            f.seek(start+offset)
+            _block = f.read(nbytes)
+            if _decompress:
+                _block = _decompress(_block)
+            _data[_i:_i+n] = _unshuffle(_block, _dtype) if entry.get('shuffle') else np.frombuffer(_block, dtype=_dtype)
+            _i += n
+    return _data
+
+def _check_savable(branch, dtype):
+    if np.dtype(dtype).hasobject:
+        raise TypeError("Cannot save branch '{}' with object values".format(branch))
+
+class tree_branch(object):
+    def __init__(self, content=None, dtype=float, capacity=0):
+        '''
+        Typed column storing the values of a single Data Tree branch in a
+        preallocated NumPy array which doubles in size when full. Values
+        appended one at a time are collected in a list and copied into the
+        array in bulk once enough have arrived or the column is next read.
+
+        Optional Arguments
+        ------------------
+
+        content  (array-like)     Initial data to store in the branch
+        dtype    (numpy dtype)    Type of the stored values
+        capacity (int)            Number of values to preallocate space for
+        '''
+        self._size = 0
+        self._data = np.empty(capacity, dtype=dtype)
+        self._pending = [] #Appended values not yet copied into the array
+        if content is not None:
+            self.extend(content)
+
+    def __len__(self):
+        return self._size+len(self._pending)
+
+    def _reserve(self, n):
+        if n > len(self._data):
+            _data = np.empty(max(n, 2*len(self._data)), dtype=self._data.dtype)
+            _data[:self._size] = self._data[:self._size]
+            self._data = _data
+
+    def _promote(self, values):
+        #Widen the column type if values cannot be stored safely, e.g. a complex mass
+        _values = np.asarray(values)
+        if np.can_cast(_values.dtype, self._data.dtype, 'same_kind'):
+            return _values
+        _numeric = _values.dtype.kind in 'biufc' and self._data.dtype.kind in 'biufc'
+        self._data = self._data.astype(np.result_type(self._data.dtype, _values.dtype) if _numeric else object)
+        return _values
+
+    def _flush(self):
+        _pending, self._pending = self._pending, []
+        if self._data.dtype.kind != 'O':
+            try:
+                _values = np.asarray(_pending)
+            except ValueError: #Sequences of different lengths
+                _values = None
+            #Plain numbers are typed and copied in one go, widening the column once if needed
+            if _values is not None and _values.ndim == 1 and _values.dtype.kind in 'biufc':
+                self.extend(_values)
+                return
+        for value in _pending:
+            self._store(value)
+
+    def _store(self, value):
+        if self._size == len(self._data):
+            self._reserve(self._size+1)
+        self._promote(value)
+        self._data[self._size] = value
+        self._size += 1
+
+    def append(self, value):
+        #Type checks and copies are left to '_flush' so that row-wise filling stays cheap
+        self._pending.append(value)
+        if len(self._pending) >= _append_buffer:
+            self._flush()
+
+    def extend(self, values):
+        if self._pending:
+            self._flush()
+        _values = self._promote(values)
+        _n = len(_values)
+        self._reserve(self._size+_n)
+        self._data[self._size:self._size+_n] = _values
+        self._size += _n
+
+    @classmethod
+    def _wrap(cls, data):
+        #Use an existing array, e.g. a memory map, as the column without copying it
+        _branch = cls(dtype=data.dtype)
+        _branch._data = data
+        _branch._size = len(data)
+        return _branch
+
+    def view(self):
+        '''Zero-copy view of the filled part of the column, only valid until the column next grows'''
+        if self._pending:
+            self._flush()
+        return self._data[:self._size]
+
+    def entry(self, i):
+        return self.view()[i]
+
+class lazy_branch(tree_branch):
+    def __init__(self, compute, length):
+        '''
+        Column whose values are only computed the first time they are needed,
+        e.g. the selected entries of another branch
+
+        Arguments
+        ---------
+
+        compute  (callable)    Returns the array of values
+        length   (int)         Number of values 'compute' will return
+        '''
+        self._compute = compute
+        self._size = length
+        self._data = None
+        self._pending = []
+
+    def _materialize(self):
+        if self._compute is not None:
+            self._data = np.asarray(self._compute())
+            self._compute = None
+
+    def _reserve(self, n):
+        self._materialize()
+        tree_branch._reserve(self, n)
+
+    def _flush(self):
+        self._materialize()
+        tree_branch._flush(self)
+
+    def append(self, value):
+        self._materialize()
+        tree_branch.append(self, value)
+
+    def extend(self, values):
+        self._materialize()
+        tree_branch.extend(self, values)
+
+    def view(self):
+        self._materialize()
+        return tree_branch.view(self)
+
+class branch_cache(object):
+    def __init__(self, maxsize=16):
+        '''
+        Memo of computed columns which keeps the most recently used ones and
+        evicts the oldest once more than 'maxsize' are held
+
+        Optional Arguments
+        ------------------
+
+        maxsize  (int)    Number of columns to keep
+        '''
+        self.maxsize = maxsize
+        self._columns = collections.OrderedDict()
+
+    def __getstate__(self):
+        #Computed columns are cheap to rebuild so are not sent between processes
+        return {'maxsize' : self.maxsize, '_columns' : collections.OrderedDict()}
+
+    def get(self, key, length):
+        _entry = self._columns.get(key)
+        if _entry is None or _entry[0] != length:
+            return None
+        self._columns.move_to_end(key)
+        return _entry[1]
+
+    def put(self, key, length, values):
+        self._columns[key] = (length, values)
+        self._columns.move_to_end(key)
+        while len(self._columns) > self.maxsize:
+            self._columns.popitem(last=False)
+
+    def clear(self):
+        self._columns.clear()
+
+class derived_branch(tree_branch):
+    def __init__(self, compute, inputs, cache):
+        '''
+        Column computed from other branches of the same entries when it is
+        read, its values are never stored in the Data Tree but kept in a
+        shared bounded cache. Values appended to it are ignored.
+
+        Arguments
+        ---------
+
+        compute  (callable)              Returns the column given the input columns
+        inputs   (list of tree_branch)   Branches passed to 'compute'
+        cache    (branch_cache)          Cache holding computed columns
+        '''
+        self._compute = compute
+        self._inputs = inputs
+        self._cache = cache
+        self._data = None
+        self._pending = []
+
+    def __len__(self):
+        return len(self._inputs[0])
+
+    def _flush(self):
+        self._pending = []
+
+    def _reserve(self, n):
+        pass
+
+    def append(self, value):
+        pass
+
+    def extend(self, values):
+        pass
+
+    def view(self):
+        _n = len(self)
+        _values = self._cache.get(self, _n)
+        if _values is None:
+            _values = self._compute(*[b.view() for b in self._inputs])
+            self._cache.put(self, _n, _values)
+        return _values
+
+    def entry(self, i):
+        _values = self._cache.get(self, len(self))
+        if _values is not None:
+            return _values[i]
+        return self._compute(*[b.view()[i:i+1 or None] for b in self._inputs])[0]
+
+class tree_row(object):
+    __slots__ = ('_columns', '_i')
+
+    def __init__(self, columns):
+        '''
+        View of one entry of a Data Tree which is moved along the tree rather
+        than recreated for each entry, see 'data_tree.rows'
+        '''
+        self._columns = columns
+        self._i = 0
+
+    def __getattr__(self, branch):
+        try:
+            return self._columns[branch][self._i]
+        except KeyError:
+            raise AttributeError(branch)
+
+    def __getitem__(self, branch):
+        return self._columns[branch][self._i]
+
+    def __str__(self):
+        return {b : self._columns[b][self._i] for b in self._columns}.__str__()
+
+    def __repr__(self):
+        return self.__str__()
+
 class tree_entry(object):
     def __init__(self, in_dict):
         self._dict = in_dict
-        for key in self._dict:
-            setattr(self, key, self._dict[key])
+        #Same as setting each value as an attribute, in one call
+        self.__dict__.update(in_dict)
 
     def __str__(self):
         return self._dict.__str__()
@@ -15,7 +420,7 @@ class tree_entry(object):
         return self.__str__()
 
 class data_tree(object):
-     def __init__(self, name=None, branches=[]):
+     def __init__(self, name=None, branches=[], dtype=float, capacity=0, cache_size=16):
          '''
          Data Tree class for storing properties of a data event
 
@@ -29,14 +434,22 @@ class data_tree(object):
          ------------------
 
          branches  (list of strings)   Names of Branches to create
+         dtype     (numpy dtype)       Default type of values stored in branches
+         capacity  (int)               Number of entries to preallocate per branch
+         cache_size (int)              Number of computed derived branches to keep
          '''
          self._tree = {}
+         self._cache = branch_cache(cache_size)
+         self._filled = 0 #Entries filled row-wise since the columns were last flushed
          self.name = name
+         self.metadata = {}
+         self._dtype = dtype
+         self._capacity = capacity
          if branches:
              for b in branches:
-                 self._tree[b] = []
+                 self.add_branch(b)
 
-     def add_branch(self, name, content=None):
+     def add_branch(self, name, content=None, dtype=None, capacity=None):
          '''
          Add a new branch to the data tree
 
@@ -49,9 +462,32 @@ class data_tree(object):
          Optional Arguments
          ------------------
  
-         content (list of any type)      Data to store in branch
+         content  (array-like)     Data to store in branch
+         dtype    (numpy dtype)    Type of branch values, use 'object' for arbitrary content
+         capacity (int)            Number of entries to preallocate
+         '''
+         self._tree[name] = tree_branch(content,
+                                        dtype=dtype if dtype is not None else self._dtype,
+                                        capacity=capacity if capacity is not None else self._capacity)
+
+     def add_derived(self, name, inputs, compute):
+         '''
+         Add a branch computed from other branches when it is first read, which
+         takes no memory until then and is recomputed if the tree has grown.
+         Values filled into it are ignored.
+
+         Arguments
+         ---------
+
+         name     (string)             Name of new branch to create
+         inputs   (list of strings)    Stored branches the values are computed from
+         compute  (callable)           Returns the column given the input columns,
+                                       a module level function if the tree is
+                                       sent to other processes
          '''
-         self._tree[name] = list(content) if content else []
+         assert not any(isinstance(self._tree[b], derived_branch) for b in inputs), \
+             "Derived branches can only be computed from stored branches"
+         self._tree[name] = derived_branch(compute, [self._tree[b] for b in inputs], self._cache)
 
      def fill(self, values):
          '''
@@ -63,13 +499,68 @@ class data_tree(object):
          values  (list of values)       List of values for each branch
          '''
 
-         assert len(values) == len(list(self._tree.keys())), "Number of Values must match Number of Branches"
+         assert len(values) == len(self._tree), "Number of Values must match Number of Branches"
+
+         #Values are collected in each column's list, see 'tree_branch', and copied in bulk every few thousand rows
+         for column, v in zip(self._tree.values(), values):
+             column._pending.append(v)
+         self._filled += 1
+         if self._filled >= _append_buffer:
+             self._filled = 0
+             for column in self._tree.values():
+                 if column._pending:
+                     column._flush()
+
+     def merge(self, other):
+         '''
+         Append all entries of another Data Tree with the same branches
+
+         Arguments
+         ---------
+
+         other  (data_tree)     Data Tree to copy entries from
+         '''
+         assert other.getBranches() == self.getBranches(), "Branches of merged Data Trees must match"
 
-         for v, branch in zip(values, self._tree):
-             self._tree[branch].append(v)
+         for branch in self._tree:
+             if not isinstance(self._tree[branch], derived_branch):
+                 self._tree[branch].extend(other.getBranch(branch))
 
      def _fill_branch(self, branch, value):
-         self._tree[branch].append(value)
+         #Used by the per-event generator, whose chunks bound the number of values waiting
+         #for '_flush', so the column is only typed when it is next read
+         self._tree[branch]._pending.append(value)
+
+     def reserve(self, branch, n):
+         '''Preallocate space for n more entries in a branch'''
+         _branch = self._tree[branch]
+         _branch._reserve(len(_branch)+n)
+
+     def extend(self, branch, values):
+         '''
+         Append many values to a single branch in one copy
+
+         Arguments
+         ---------
+
+         branch  (string)        Name of the branch to fill
+         values  (array-like)    Values to append
+         '''
+         self._tree[branch].extend(values)
+
+     def fill_columns(self, columns):
+         '''
+         Fill many entries at once from whole columns
+ 
+         Arguments
+         ---------
+
+         columns  (dict of array-like)    Values to append keyed by branch name
+         '''
+         assert len(columns) == len(self._tree), "Number of Columns must match Number of Branches"
+
+         for branch in columns:
+             self._tree[branch].extend(columns[branch])
 
      def getN(self):
          '''Get Number of Entries in Data Tree'''
@@ -79,18 +570,283 @@ class data_tree(object):
              return None
  
      def getBranch(self, branch):
-         return self._tree[branch]
+         '''Return a zero-copy array view of the values in a branch'''
+         return self._tree[branch].view()
 
      def getBranches(self):
          return list(self._tree.keys())
 
      def getEntry(self, i):
          '''Return the values for the i-th entry in the Data Tree'''
+         _n = self.getN() or 0
+         if not -_n <= i < _n:
+             raise IndexError("Entry {} is out of range for a Data Tree of {} entries".format(i, _n))
+         i = i if i >= 0 else _n+i
          _output = {}
-         for branch in self._tree:
-             _output[branch] = self._tree[branch][i]
+         for branch, column in self._tree.items():
+             if column.__class__ is not tree_branch:
+                 #Derived and lazy branches compute a single value rather than the whole column
+                 _output[branch] = column.entry(i)
+                 continue
+             if column._pending:
+                 column._flush()
+             #Every column holds at least the checked number of values, so the array itself is indexed
+             _output[branch] = column._data[i]
          return tree_entry(_output)
 
+     def _entry_rows(self, branch):
+         #Values of a branch as one row per entry, e.g. of shape (N, 2) for two identical particles
+         return self.getBranch(branch).reshape(-1, self._per_entry(branch))
+
+     def _evaluate(self, expr):
+         '''Value of an expression as an (N, k) array with one row per entry'''
+         _k = {b : self._per_entry(b) for b in expression.names(expr) if b in self._tree}
+         if len(set(_k.values())-{1}) > 1:
+             raise ValueError("Branches in '{}' hold different numbers of values per entry {}".format(expr, _k))
+         _values = expression.evaluate(expr, self._entry_rows)
+         return np.broadcast_to(_values, (self.getN() or 0, max(_k.values(), default=1)))
+
+     def _evaluate_together(self, exprs):
+         '''Values of several expressions broadcast to the same (N, k) shape'''
+         _values = [self._evaluate(e) for e in exprs]
+         try:
+             return list(np.broadcast_arrays(*_values))
+         except ValueError:
+             raise ValueError("Expressions {} hold different numbers of values per entry".format(list(exprs)))
+
+     def evaluate(self, expr):
+         '''
+         Evaluate an expression of branch names over whole columns, see
+         hepgen.expression for the supported syntax. Branches holding several
+         values per entry, e.g. for identical particles, enter as an (N, k)
+         array with one row per entry, which single valued branches are
+         broadcast against, and the result then has the same shape.
+
+         Arguments
+         ---------
+
+         expr  (string)     Expression, e.g. 'sqrt(Kplus_PX**2+Kplus_PY**2)'
+         '''
+         _values = self._evaluate(expr)
+         return _values[:, 0] if _values.shape[1] == 1 else _values
+
+     def define(self, name, expr):
+         '''
+         Add a branch computed column-wise from an expression of other branches,
+         holding k values per entry if the expression uses branches which do
+
+         Arguments
+         ---------
+
+         name  (string)     Name of the new branch
+         expr  (string)     Expression defining it, e.g. 'Kplus_PT/Kplus_P'
+         '''
+         self._tree[name] = tree_branch._wrap(np.array(self._evaluate(expr)).ravel())
+
+     def take(self, index):
+         '''
+         New Data Tree with only the given entries. Columns are gathered when
+         they are first accessed, so unused branches are never copied.
+         Branches holding several values per entry, e.g. for identical
+         particles, keep all values of each selected entry.
+
+         Arguments
+         ---------
+
+         index  (numpy array)    Boolean mask over the entries or entry indices
+         '''
+         _n = self.getN()
+         _index = np.asarray(index)
+         if _index.dtype == bool:
+             assert len(_index) == _n, "Mask length must match Number of Entries"
+             _index = np.flatnonzero(_index)
+
+         _columns = {}
+         for branch in self._stored():
+             _k = self._per_entry(branch)
+             _rows = _index if _k == 1 else (_index[:, None]*_k+np.arange(_k)).ravel()
+             _columns[branch] = lazy_branch(lambda b=self._tree[branch], r=_rows: b.view()[r], len(_rows))
+         return self._like(_columns)
+
+     def _stored(self):
+         return [b for b in self._tree if not isinstance(self._tree[b], derived_branch)]
+
+     def _per_entry(self, branch):
+         #Number of values per entry, more than one e.g. for identical particles
+         _n = self.getN()
+         _k, _rem = divmod(len(self._tree[branch]), _n) if _n else (1, 0)
+         assert _rem == 0, "Branch '{}' length is not a multiple of the Number of Entries".format(branch)
+         return _k
+
+     def _like(self, columns, name=None):
+         '''
+         New Data Tree with the settings, metadata and branch order of this one
+         holding the given stored columns, derived branches are recomputed from
+         the new columns
+         '''
+         _tree = data_tree(name or self.name, dtype=self._dtype, cache_size=self._cache.maxsize)
+         _tree.metadata = dict(self.metadata)
+         _new = {id(self._tree[b]) : columns[b] for b in columns}
+         for branch in self._tree:
+             _branch = self._tree[branch]
+             if branch in columns:
+                 _tree._tree[branch] = columns[branch]
+             else:
+                 _tree._tree[branch] = derived_branch(_branch._compute, [_new[id(i)] for i in _branch._inputs], _tree._cache)
+         return _tree
+
+     def shard(self, n):
+         '''
+         Split into n Data Trees with nearly equal numbers of entries. Stored
+         branches of the shards are views of this tree's columns, so no values
+         are copied, and only remain valid while this tree's columns do not grow.
+
+         Arguments
+         ---------
+
+         n  (int)     Number of shards
+         '''
+         _n = self.getN() or 0
+         _bounds = [i*_n//n for i in range(n+1)]
+         _k = {b : self._per_entry(b) for b in self._stored()}
+         return [self._like({b : tree_branch._wrap(self._tree[b].view()[lo*_k[b]:hi*_k[b]]) for b in _k})
+                 for lo, hi in zip(_bounds[:-1], _bounds[1:])]
+
+     @classmethod
+     def concat(cls, trees, name=None):
+         '''
+         New Data Tree with the entries of all trees in order. Branches are
+         checked once and each column is allocated once and filled with one
+         bulk copy per tree. Derived branches stay derived if they are derived
+         in every tree.
+
+         Arguments
+         ---------
+
+         trees  (list of data_tree)   Data Trees with the same branches
+
+
+         Optional Arguments
+         ------------------
+
+         name   (string)              Name of the new tree, that of the first by default
+         '''
+         trees = list(trees)
+         assert trees, "Need at least one Data Tree to concatenate"
+         _first = trees[0]
+         _branches = _first.getBranches()
+         for tree in trees[1:]:
+             assert tree.getBranches() == _branches, "Branches of concatenated Data Trees must match"
+
+         _derived = [b for b in _first._tree if all(isinstance(t._tree[b], derived_branch) for t in trees)]
+         _columns = {b : tree_branch._wrap(np.concatenate([t.getBranch(b) for t in trees]))
+                     for b in _branches if b not in _derived}
+         _tree = _first._like(_columns, name)
+         for tree in trees[1:]:
+             _tree.metadata.update(tree.metadata)
+         return _tree
+
+     def select(self, selection, require='all'):
+         '''
+         New Data Tree with the entries passing a selection, see 'take'
+
+         Arguments
+         ---------
+
+         selection  (string or numpy array)   Expression such as
+                                              'Kplus_PT > 500 and piplus_ETA < 4',
+                                              or a mask or index array
+
+
+         Optional Arguments
+         ------------------
+
+         require    (string)                  For branches holding several values
+                                              per entry, keep entries where 'all'
+                                              or 'any' of the values pass
+         '''
+         assert require in ('all', 'any'), "'require' must be 'all' or 'any'"
+         if isinstance(selection, str):
+             _mask = self._evaluate(selection)
+             selection = _mask.all(axis=1) if require == 'all' else _mask.any(axis=1)
+         return self.take(selection)
+
+     def rows(self, branches=None):
+         '''
+         Iterate over the entries with a single reused row view, so no objects
+         are created per entry. Branches holding k values per entry give an
+         array of the k values.
+
+         Optional Arguments
+         ------------------
+
+         branches  (list of strings)    Branches the row gives access to, all by default
+         '''
+         _row = tree_row({b : self._entry_rows(b) if self._per_entry(b) > 1 else self.getBranch(b)
+                          for b in (branches or self._tree)})
+         for i in range(self.getN() or 0):
+             _row._i = i
+             yield _row
+
+     def save(self, path, compression=None):
+         '''
+         Write the Data Tree to a binary file, storing each branch as one
+         contiguous typed array after a small header describing the branches.
+         The file is written next to 'path' and only replaces it once complete.
+
+         Arguments
+         ---------
+
+         path  (string)     Address of the output file
+
+
+         Optional Arguments
+         ------------------
+
+         compression  (string)   Compress branches with zlib, lzma, bz2, lz4 or
+                                  zstd, see 'tree_writer'
+         '''
+         if compression:
+             with tree_writer(path, compression) as writer:
+                 writer.write(self)
+             return
+         _branches = [(b, self._tree[b].view().dtype, len(self._tree[b])) for b in self._tree]
+         for branch, dtype, _ in _branches:
+             _check_savable(branch, dtype)
+         with _replacing(path) as f:
+             _write_header(f, self.name, _branch_entries(_branches), self.metadata)
+             for branch in self._tree:
+                 self._tree[branch].view().tofile(f)
+                 _pad(f)
+
+     @classmethod
+     def open(cls, path):
+         '''
+         Open a Data Tree written by 'save' or 'tree_writer'. Branches are memory
+         mapped so only the columns which are accessed are read from disk,
+         branches stored in blocks, e.g. compressed ones, are read and
+         decompressed on first access.
+
+         Arguments
+         ---------
+
+         path  (string)     Address of the Data Tree file
+         '''
+         _header, _start = _read_header(path)
+         _tree = cls(_header['name'])
+         _tree.metadata = _header.get('metadata', {})
+         for branch in _header['branches']:
+             _dtype = np.dtype(branch['dtype'])
+             if 'blocks' in branch:
+                 _tree._tree[branch['name']] = lazy_branch(lambda b=branch: _read_blocks(path, _start, b), branch['length'])
+                 continue
+             if branch['length'] > 0:
+                 _data = np.memmap(path, dtype=_dtype, mode='r', offset=_start+branch['offset'], shape=(branch['length'],))
+             else:
+                 _data = np.empty(0, dtype=_dtype)
+             _tree._tree[branch['name']] = tree_branch._wrap(_data)
+         return _tree
+
      def __str__(self):
          _str='''
 ====================================
@@ -104,9 +860,351 @@ class data_tree(object):
 
          return _str
 
+     def histogram(self, branch, bins=100, range=None, weights=None):
+         '''
+         Bin branches or expressions in one pass without plotting, returning a
+         Histogram which can keep being filled from further trees and merged
+         with others, see hepgen.histogram
+
+         Arguments
+         ---------
+
+         branch   (string or tuple)       Branch name or expression, a pair of
+                                          these for a 2D histogram
+
+
+         Optional Arguments
+         ------------------
+
+         bins     (int, array or tuple)   Number of bins or bin edges per axis, or a
+                                          numpy bin rule such as 'auto' which is
+                                          resolved from the finite values in range
+         range    (tuple)                 (low, high) per axis, the finite range of
+                                          the values if not given
+         weights  (string or array)       Branch name, expression or array of weights
+         '''
+         _branches = branch if isinstance(branch, (tuple, list)) else [branch]
+         _values = self._evaluate_together(list(_branches)+([weights] if isinstance(weights, str) else []))
+         _weights = _values.pop() if isinstance(weights, str) else weights
+         if range is None:
+             _range = []
+             for v in _values:
+                 _finite = v[np.isfinite(v)]
+                 _lo, _hi = (_finite.min(), _finite.max()) if len(_finite) else (0., 1.)
+                 _range.append((_lo-0.5, _hi+0.5) if _lo == _hi else (_lo, _hi)) #As numpy.histogram
+             range = _range if len(_values) == 2 else _range[0]
+         if any(isinstance(b, str) for b in (bins if isinstance(bins, tuple) else (bins,))):
+             #Bin rules need the values, so the edges are fixed here from those of this tree
+             _bins = bins if isinstance(bins, tuple) else (bins,)*len(_values)
+             _ranges = range if len(_values) == 2 else [range]
+             _bins = tuple(np.histogram_bin_edges(v[np.isfinite(v)], b, r) if isinstance(b, str) else b
+                           for v, b, r in zip(_values, _bins, _ranges))
+             bins = _bins if len(_values) == 2 else _bins[0]
+         _hist = Histogram(bins=bins, range=range, branch=branch, weights=weights if isinstance(weights, str) else None)
+         return _hist.fill(*_values, weights=_weights)
+
      def draw(self, branch, bins=100, *args, **kwargs):
-         import matplotlib.pyplot as plt
-         plt.hist(self._tree[branch], bins=bins, *args, **kwargs)
-         plt.title('A Histogram of {}'.format(branch))
-         plt.xlabel(branch)
-         plt.show()
+         _hist = self.histogram(branch, bins, kwargs.pop('range', None), kwargs.pop('weights', None))
+         _hist.draw(*args, **kwargs)
+
+class tree_writer(object):
+     def __init__(self, path, compression=None, level=None, nevts=None):
+         '''
+         Write Data Trees arriving chunk by chunk, e.g. as the sink of a
+         streaming HEPGen run, to a single Data Tree file. Each value is
+         written once, at its final place in the file, and the header follows
+         the data so it can hold the metadata of all trees. The file is
+         written under a temporary name and only moved to 'path' on 'close',
+         'abort', or an error in a with block, removes it instead.
+
+         Arguments
+         ---------
+
+         path  (string)     Address of the output file
+
+
+         Optional Arguments
+         ------------------
+
+         compression  (string)   Compress the values of each written tree with
+                                 zlib, lzma, bz2, lz4 or zstd. lz4 and zstd fall
+                                 back to a fast zlib setting when not installed.
+                                 The blocks of each tree are appended as they
+                                 arrive and indexed in the header.
+         level        (int)      Compression level
+         nevts        (int)      Total number of entries which will be written,
+                                 when given uncompressed columns are laid out
+                                 up front and filled in place so they can be
+                                 memory mapped when the file is opened. Without
+                                 it uncompressed values are stored in blocks
+                                 as compressed ones are.
+         '''
+         self._path = path
+         self._temp = '{}.part'.format(path)
+         self._codec = _codec(compression, level) if compression else None
+         self._nevts = nevts
+         self._name = None
+         self._branches = None
+         self._capacity = None
+         self.metadata = {}
+         self._file = open(self._temp, 'wb')
+         self._file.write(_magic+struct.pack('<Q', 0)) #No header here, it follows the data
+         _pad(self._file)
+         self._start = self._file.tell()
+
+     def _layout(self, tree):
+         '''Header entries of the branches, reserving the space of each column if the size is known'''
+         _n = tree.getN()
+         _contiguous = self._nevts is not None and not self._codec
+         _columns = []
+         for branch in tree.getBranches():
+             _values = tree.getBranch(branch)
+             _check_savable(branch, _values.dtype)
+             _columns.append((branch, _values.dtype, self._nevts*(len(_values)//_n) if _contiguous else 0))
+         _entries = _branch_entries(_columns)
+         if _contiguous:
+             self._capacity = {e['name'] : e['length'] for e in _entries}
+             self._file.truncate(self._start+(_aligned(_entries[-1]['offset']+_nbytes(_entries[-1])) if _entries else 0))
+         else:
+             for entry in _entries:
+                 entry.update({'offset' : 0, 'compression' : self._codec[0] if self._codec else None,
+                               'shuffle' : bool(self._codec), 'blocks' : []})
+         for entry in _entries:
+             entry['length'] = 0
+         self._branches = collections.OrderedDict((e['name'], e) for e in _entries)
+
+     def write(self, tree):
+         '''Append all entries of a Data Tree to the output'''
+         assert self._file is not None, "Data Tree writer is closed"
+         if self._name is None:
+             self._name = tree.name
+         self.metadata.update(tree.metadata)
+         if not tree.getN():
+             return
+         if self._branches is None:
+             self._layout(tree)
+         assert tree.getBranches() == list(self._branches), "Branches of written Data Trees must match"
+
+         for branch, entry in self._branches.items():
+             _values = np.asarray(tree.getBranch(branch), dtype=entry['dtype'])
+             if 'blocks' in entry:
+                 _offset = self._file.seek(0, os.SEEK_END)-self._start
+                 if self._codec:
+                     _block = self._codec[1](_shuffle(_values))
+                     self._file.write(_block)
+                     entry['blocks'].append([_offset, len(_block), len(_values)])
+                 else:
+                     _values.tofile(self._file)
+                     entry['blocks'].append([_offset, _values.nbytes, len(_values)])
+             else:
+                 assert entry['length']+len(_values) <= self._capacity[branch], \
+                     "More than the {} entries given were written to '{}'".format(self._nevts, self._path)
+                 self._file.seek(self._start+entry['offset']+entry['length']*_values.itemsize)
+                 _values.tofile(self._file)
+             entry['length'] += len(_values)
+
+     def __call__(self, tree):
+         self.write(tree)
+
+     def close(self):
+         '''Write the header after the data and move the file to its address'''
+         if self._file is None:
+             return
+         _entries = list(self._branches.values()) if self._branches else []
+         for entry in _entries:
+             if 'blocks' in entry:
+                 entry['nbytes'] = sum(b[1] for b in entry['blocks'])
+         _header = _header_bytes(self._name, _entries, self.metadata)
+         self._file.seek(0, os.SEEK_END)
+         self._file.write(_header+_trailer.pack(len(_header), _magic))
+         self._file.close()
+         self._file = None
+         os.replace(self._temp, self._path)
+
+     def abort(self):
+         '''Remove the partly written file, leaving no output'''
+         if self._file is None:
+             return
+         self._file.close()
+         self._file = None
+         os.remove(self._temp)
+
+     def __enter__(self):
+         return self
+
+     def __exit__(self, exc_type, *args):
+         #A run which failed must not leave a file that looks complete
+         if exc_type is None:
+             self.close()
+         else:
+             self.abort()
+
+_stop = object() #Tells the thread of a threaded_sink that no more trees will arrive
+
+class threaded_sink(object):
+     def __init__(self, sink, maxsize=4):
+         '''
+         Pass Data Trees to a sink, e.g. a tree_writer, in a background thread
+         so that writing and compressing a chunk overlaps with generating the
+         next ones. Calls block while 'maxsize' trees are waiting, which bounds
+         memory use when the sink is slower than the generator.
+
+         Arguments
+         ---------
+
+         sink     (callable)     Called with each Data Tree in the background
+                                 thread, closed on 'close' if it has a close method
+                                 and aborted on 'abort' if it has an abort method
+
+
+         Optional Arguments
+         ------------------
+
+         maxsize  (int)          Number of trees allowed to wait for the sink
+         '''
+         self._sink = sink
+         self._queue = queue.Queue(maxsize)
+         self._error = None
+         self._aborted = False
+         self._thread = threading.Thread(target=self._run, name='hepgen-writer', daemon=True)
+         self._thread.start()
+
+     def _run(self):
+         while True:
+             _tree = self._queue.get()
+             if _tree is _stop:
+                 return
+             if self._error is None and not self._aborted: #Keep emptying the queue so callers do not block
+                 try:
+                     self._sink(_tree)
+                 except BaseException as e:
+                     self._error = e
+
+     def _raise(self):
+         if self._error is not None:
+             raise self._error
+
+     def __call__(self, tree):
+         self._raise()
+         self._queue.put(tree)
+
+     def _join(self):
+         if self._thread.is_alive():
+             self._queue.put(_stop)
+             self._thread.join()
+
+     def close(self):
+         '''Wait for all waiting trees to be written and close the sink'''
+         self._join()
+         if self._error is not None:
+             self.abort()
+             raise self._error
+         if hasattr(self._sink, 'close'):
+             self._sink.close()
+
+     def abort(self):
+         '''Drop the trees still waiting and abort the sink, e.g. after an error in the generator'''
+         self._aborted = True
+         self._join()
+         if hasattr(self._sink, 'abort'):
+             self._sink.abort()
+
+     def __enter__(self):
+         return self
+
+     def __exit__(self, exc_type, *args):
+         if exc_type is None:
+             self.close()
+         else:
+             self.abort()
+
+def _copy_range(src, dst, nbytes, buffer_size=1 << 24):
+    while nbytes > 0:
+        _data = src.read(min(nbytes, buffer_size))
+        if not _data:
+            raise IOError("Unexpected end of Data Tree file '{}'".format(src.name))
+        dst.write(_data)
+        nbytes -= len(_data)
+
+def merge_files(paths, path, name=None):
+    '''
+    Merge saved Data Tree files into one file without loading them. Branches
+    are checked once from the headers and each column of each input is
+    copied in bulk to its place in the output, compressed blocks included.
+    Branches whose type or compression differs between inputs are read and
+    written uncompressed as the common type. The output only appears once the
+    merge has finished, and must not be one of the inputs.
+
+    Arguments
+    ---------
+
+    paths  (list of strings)   Addresses of the Data Tree files to merge, in order
+    path   (string)            Address of the output file
+
+
+    Optional Arguments
+    ------------------
+
+    name   (string)            Name of the merged tree, that of the first file by default
+    '''
+    paths = list(paths)
+    assert paths, "Need at least one Data Tree file to merge"
+    for p in paths:
+        #The output is written before the inputs are read, it must not be one of them
+        assert os.path.abspath(p) != os.path.abspath(path) and not (os.path.exists(path) and os.path.samefile(p, path)), \
+            "Output '{}' of merge_files is also one of its inputs".format(path)
+    _headers = [_read_header(p) for p in paths]
+    _names = [b['name'] for b in _headers[0][0]['branches']]
+    for p, (header, _) in zip(paths, _headers):
+        assert [b['name'] for b in header['branches']] == _names, \
+            "Branches of merged Data Tree files must match, '{}' differs".format(p)
+
+    _metadata = {}
+    for header, _ in _headers:
+        _metadata.update(header.get('metadata', {}))
+
+    _branches, _copy = [], []
+    for i, branch in enumerate(_names):
+        _inputs = [header['branches'][i] for header, _ in _headers]
+        _dtype = np.result_type(*[np.dtype(b['dtype']) for b in _inputs])
+        _length = sum(b['length'] for b in _inputs)
+        _codecs = {(b.get('compression'), b.get('shuffle', False), 'blocks' in b) for b in _inputs}
+        _same = len(_codecs) == 1 and all(np.dtype(b['dtype']) == _dtype for b in _inputs)
+        _codec, _shuffle, _ = _codecs.pop() if _same else (None, False, False)
+        _extra = {}
+        if _codec:
+            #Blocks are copied one after the other, so their offsets follow from their sizes,
+            #uncompressed blocks simply join into a contiguous column
+            _blocks = [block[1:] for b in _inputs for block in _branch_blocks(b)]
+            _extra = {'compression' : _codec, 'shuffle' : _shuffle, 'blocks' : _blocks,
+                      'nbytes' : sum(block[0] for block in _blocks)}
+        _branches.append((branch, _dtype, _length, _extra))
+        _copy.append(_same)
+
+    _entries = _branch_entries(_branches)
+    with _replacing(path) as f:
+        _start = _write_header(f, name or _headers[0][0]['name'], _entries, _metadata)
+        _end = _start+(_aligned(_entries[-1]['offset']+_nbytes(_entries[-1])) if _entries else 0)
+        f.truncate(_end) #Gaps between the columns read as the zero padding
+
+        _written = [0]*len(_entries)
+        for p, (header, start) in zip(paths, _headers):
+            _tree = None
+            with open(p, 'rb') as src:
+                for i, (entry, source) in enumerate(zip(_entries, header['branches'])):
+                    f.seek(_start+entry['offset']+_written[i])
+                    if _copy[i] and 'blocks' in source:
+                        for offset, nbytes, _ in _branch_blocks(source):
+                            src.seek(start+offset)
+                            _copy_range(src, f, nbytes)
+                            _written[i] += nbytes
+                    elif _copy[i]:
+                        src.seek(start+source['offset'])
+                        _copy_range(src, f, _nbytes(source))
+                        _written[i] += _nbytes(source)
+                    else:
+                        if _tree is None:
+                            _tree = data_tree.open(p)
+                        _values = np.asarray(_tree.getBranch(source['name']), dtype=np.dtype(entry['dtype']))
+                        _values.tofile(f)
+                        _written[i] += _values.nbytes
@@ -0,0 +1,103 @@
+#============================================================================#
+#                            Decay Chain Module                              #
+#============================================================================#
+'''
+Decays whose daughters decay further, e.g. the K+ in 'B(c)+ -> phi(1020)0 K+'
+decaying with 'K+ -> pi+ pi+ pi-'. A chain is compiled once into a flat list
+of particles in breadth-first order, grouped into levels of decays, so the
+batch engine of HEPGen runs each decay of a level once for all events rather
+than recursing per event.
+
+Branches of particles further down the chain are prefixed by the branch of
+the particle they come from, e.g. 'Kplus_piminus_PX'.
+'''
+
+import collections
+
+from hepgen import decays
+
+chain_node = collections.namedtuple('chain_node', ['prefix', 'particle', 'parent', 'decay', 'level'])
+
+_max_depth = 16 #Guards against decays which lead back to their own mother
+
+class DecayPlan(object):
+    def __init__(self, decay, chain=False, table=None):
+        '''
+        Flat, topologically ordered plan of a decay chain
+
+        Arguments
+        ---------
+
+        decay  (Decay)          Decay of the mother particle
+
+
+        Optional Arguments
+        ------------------
+
+        chain  (bool or dict)   Also decay the daughters which have a decay in the
+                                table, taking the one with the largest known
+                                branching ratio. A dict of particle name to
+                                decay ID, or None to keep the particle stable,
+                                overrides the choice for those particles, the
+                                decay must be one of that particle.
+        table  (DecayList)      Decays to resolve daughters against, defaults
+                                to the DecayTable
+        '''
+        self.decay = decay
+        self.nodes = [chain_node(decay.Mother.name, decay.Mother, None, decay, 0)]
+        self.children = {}
+        self.levels = []
+
+        _table = table if table is not None or not chain else decays.decay_table
+        _queue = collections.deque([0])
+        while _queue:
+            _i = _queue.popleft()
+            _node = self.nodes[_i]
+            assert _node.level < _max_depth, "Decay chain of '{}' is too deep".format(decay.ID)
+            self.children[_i] = []
+            for daughter in _node.decay.Daughters:
+                _prefix = daughter.name if _node.parent is None else '{}_{}'.format(_node.prefix, daughter.name)
+                _decay = self._resolve(daughter, chain, _table)
+                self.children[_i].append(len(self.nodes))
+                if _decay is not None:
+                    _queue.append(len(self.nodes))
+                self.nodes.append(chain_node(_prefix, daughter, _i, _decay, _node.level+1))
+
+        #Decays of each level as (decay, [indices of the decaying nodes])
+        for node_index, node in enumerate(self.nodes):
+            if node.decay is None:
+                continue
+            while len(self.levels) <= node.level:
+                self.levels.append(collections.OrderedDict())
+            self.levels[node.level].setdefault(node.decay.ID, (node.decay, []))[1].append(node_index)
+        self.levels = [list(level.values()) for level in self.levels]
+
+    @staticmethod
+    def _resolve(particle, chain, table):
+        if not chain:
+            return None
+        if isinstance(chain, dict) and particle.name in chain:
+            if chain[particle.name] is None:
+                return None
+            _decay = table(chain[particle.name])
+            if _decay.Mother.name != particle.name:
+                raise ValueError("Decay '{}' is of {}, it cannot decay {}".format(_decay.ID, _decay.Mother.name, particle.name))
+            return _decay
+        _decays = [d for d in table if d.Mother.name == particle.name]
+        return max(_decays, key=lambda d: d.BR) if _decays else None
+
+    def prefixes(self):
+        '''Branch prefix of each particle in plan order'''
+        return [n.prefix for n in self.nodes]
+
+    def summary(self):
+        '''Description of the chain for the tree metadata'''
+        return [{'branch' : n.prefix,
+                 'parent' : self.nodes[n.parent].prefix if n.parent is not None else None,
+                 'decay'  : n.decay.ID if n.decay is not None else None} for n in self.nodes]
+
+    def __str__(self):
+        _str = ''
+        for n in self.nodes:
+            _str += '{}{}{}\n'.format('  '*n.level, n.prefix, ' -> {}'.format(n.decay.Descriptor.strip()) if n.decay else '')
+        return _str
@@ -1,10 +1,32 @@
 from hepgen import particle
+import hashlib
+import json
 import os
+import tempfile
 _mod_loc = os.path.abspath(__file__).replace('decays.py', '')
 
+_cache_version = 1
+
 def get_particle(symbol):
     return particle.pdg.get(symbol)
 
+def _cache_dir():
+    '''Directory holding the parsed decay file caches, set with HEPGEN_CACHE_DIR'''
+    return os.environ.get('HEPGEN_CACHE_DIR',
+                          os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser(os.path.join('~', '.cache'))), 'hepgen'))
+
+def _cache_file(directory):
+    return os.path.join(_cache_dir(), 'decays_{}.json'.format(hashlib.sha1(directory.encode('utf-8')).hexdigest()[:16]))
+
+def _parse_record(text):
+    '''Read the 'key: value' lines of a .dcf file'''
+    _tmp = {}
+    for l in text.splitlines():
+        _parts = l.split(':')
+        if len(_parts) > 1:
+            _tmp[_parts[0]] = _parts[1]
+    return _tmp
+
 class Decay(object):
     def __init__(self, _id):
         pass
@@ -13,15 +35,30 @@ class Decay(object):
          return self.Descriptor
 
 class DecayList:
-    def __init__(self):
+    def __init__(self, directories=None):
+        '''
+        Table of all decays described by .dcf files, indexed by decay ID.
+        Parsed files are cached per directory and only re-read when their
+        modification time and content hash change.
+
+        Optional Arguments
+        ------------------
+
+        directories  (list of strings)   Extra decay file directories to load after
+                                         the bundled decays, also read from the
+                                         HEPGEN_DECAY_PATH environment variable
+        '''
         self._decays = {}
         self._parse_decay_files()
+        _extra = [d for d in os.environ.get('HEPGEN_DECAY_PATH', '').split(os.pathsep) if d]
+        for directory in _extra+list(directories or []):
+            self.add_directory(directory)
 
     def __call__(self, _id):
-        for d in self._decays:
-            if self._decays[d].ID == _id:
-                return self._decays[d]
-        raise Exception("Could Not Find Decay")
+        try:
+            return self._decays[_id]
+        except KeyError:
+            raise Exception("Could Not Find Decay")
 
     def __iter__(self):
         for d in self._decays:
@@ -30,31 +67,91 @@ class DecayList:
     def __str__(self):
         return '\n'.join([self._decays[i].Descriptor for i in self._decays])
 
-    def _parse_decay_files(self):
+    def add_directory(self, directory):
+        '''
+        Load all .dcf files in a directory, decays with the ID of an already
+        loaded decay replace it
+
+        Arguments
+        ---------
+
+        directory  (string)     Address of the decay file directory, which
+                                must exist
+        '''
+        if not os.path.isdir(directory):
+            raise IOError("Decay file directory '{}' does not exist".format(directory))
+        for _record in self._read_directory(os.path.abspath(directory)):
+            _decay = self._make_decay(_record)
+            self._decays[_decay.ID] = _decay
+
+    def _read_directory(self, directory):
         from glob import glob
-        import os
-        _files = glob(os.path.join(os.path.join(_mod_loc, 'decay_files'), '*.dcf'))
+        _files = sorted(glob(os.path.join(directory, '*.dcf')))
+
+        try:
+            with open(_cache_file(directory), 'r') as f:
+                _cache = json.load(f)
+            assert _cache['version'] == _cache_version
+        except (IOError, ValueError, KeyError, AssertionError):
+            _cache = {'version' : _cache_version, 'files' : {}}
 
-        assert len(_files) > 0, "No Decay Files Found {}".format(os.path.join(os.path.join(_mod_loc, 'decay_files'), '*.dcf'))
-     
+        _entries, _changed = {}, len(_files) != len(_cache['files'])
         for file_addr in _files:
-           _tmp = {}
-           with open(file_addr, 'r') as f:
-               for l in f.readlines():
-                   l = l.replace('\n', '')
-                   try:
-                       _tmp[l.split(':')[0]] = l.split(':')[1]
-                   except IndexError:
-                       continue
-
-           _decay = Decay(_tmp['ID'])
-           _decay.ID = _tmp['ID'].replace(' ','')
-           _decay.BR = float(_tmp['Branching Ratio'])
-           _decay.Descriptor = _tmp['Decay']
-           _decay.Description = _tmp['Description']
-           _decay.Mother = get_particle(_decay.Descriptor.split(' -> ')[0].replace(' ', ''))
-           _decay.Daughters = [get_particle(i.replace(' ','')) for i in _decay.Descriptor.split(' -> ')[1].split(' ')]
-
-           self._decays[_decay.ID] = _decay
-
-decay_table = DecayList()
+            _stat = os.stat(file_addr)
+            _entry = _cache['files'].get(os.path.basename(file_addr))
+            if not _entry or _entry['mtime'] != _stat.st_mtime_ns or _entry['size'] != _stat.st_size:
+                with open(file_addr, 'rb') as f:
+                    _content = f.read()
+                _hash = hashlib.sha1(_content).hexdigest()
+                if not _entry or _entry['sha1'] != _hash:
+                    _entry = {'sha1' : _hash, 'record' : _parse_record(_content.decode('utf-8'))}
+                _entry.update(mtime=_stat.st_mtime_ns, size=_stat.st_size)
+                _changed = True
+            _entries[os.path.basename(file_addr)] = _entry
+
+        if _changed:
+            _cache['files'] = _entries
+            try:
+                os.makedirs(_cache_dir(), exist_ok=True)
+                #Many jobs may start at once, so write a private file and move it into place
+                #in one step, readers then always see a whole cache from one of the writers
+                _fd, _temp = tempfile.mkstemp(prefix='decays_', suffix='.tmp', dir=_cache_dir())
+                try:
+                    with os.fdopen(_fd, 'w') as f:
+                        json.dump(_cache, f)
+                    os.replace(_temp, _cache_file(directory))
+                except BaseException:
+                    os.remove(_temp)
+                    raise
+            except (IOError, OSError):
+                pass #The cache is optional, e.g. on a read-only home directory
+
+        return [_entries[f]['record'] for f in _entries]
+
+    def _make_decay(self, _tmp):
+        _decay = Decay(_tmp['ID'])
+        _decay.ID = _tmp['ID'].replace(' ','')
+        _decay.BR = float(_tmp['Branching Ratio'])
+        _decay.Descriptor = _tmp['Decay']
+        _decay.Description = _tmp['Description']
+        _decay.Mother = get_particle(_decay.Descriptor.split(' -> ')[0].replace(' ', ''))
+        _decay.Daughters = [get_particle(i.replace(' ','')) for i in _decay.Descriptor.split(' -> ')[1].split(' ')]
+        return _decay
+
+    def _parse_decay_files(self):
+        _dir = os.path.join(_mod_loc, 'decay_files')
+        _records = self._read_directory(_dir)
+
+        assert len(_records) > 0, "No Decay Files Found {}".format(os.path.join(_dir, '*.dcf'))
+
+        for _record in _records:
+            _decay = self._make_decay(_record)
+            self._decays[_decay.ID] = _decay
+
+def __getattr__(name):
+    #Parse the decay files on first use of 'decay_table' rather than at import
+    if name == 'decay_table':
+        global decay_table
+        decay_table = DecayList()
+        return decay_table
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
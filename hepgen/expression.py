@@ -0,0 +1,94 @@
+#============================================================================#
+#                            Expression Module                               #
+#============================================================================#
+'''
+Column-wise evaluation of selection and definition strings such as
+
+    "Kplus_PT > 500 and piplus_ETA < 4"
+    "sqrt(Kplus_PX**2 + Kplus_PY**2)"
+
+Expressions are parsed with 'ast' and only arithmetic, comparisons, boolean
+operators and the functions below are allowed, so arbitrary code is never
+run. 'and', 'or' and 'not' act element-wise on whole columns.
+'''
+
+import ast
+import functools
+import operator
+import numpy as np
+
+_functions = {'abs' : np.abs, 'sqrt' : np.sqrt, 'exp' : np.exp, 'log' : np.log,
+              'log10' : np.log10, 'sin' : np.sin, 'cos' : np.cos, 'tan' : np.tan,
+              'arcsin' : np.arcsin, 'arccos' : np.arccos, 'arctan' : np.arctan,
+              'arctan2' : np.arctan2, 'arcsinh' : np.arcsinh, 'hypot' : np.hypot,
+              'minimum' : np.minimum, 'maximum' : np.maximum, 'where' : np.where,
+              'isnan' : np.isnan, 'isfinite' : np.isfinite}
+
+_constants = {'pi' : np.pi, 'e' : np.e, 'inf' : np.inf, 'nan' : np.nan}
+
+_binary = {ast.Add : operator.add, ast.Sub : operator.sub, ast.Mult : operator.mul,
+           ast.Div : operator.truediv, ast.FloorDiv : operator.floordiv,
+           ast.Mod : operator.mod, ast.Pow : operator.pow,
+           ast.BitAnd : np.logical_and, ast.BitOr : np.logical_or}
+
+_unary = {ast.USub : operator.neg, ast.UAdd : operator.pos,
+          ast.Not : np.logical_not, ast.Invert : np.logical_not}
+
+_compare = {ast.Lt : operator.lt, ast.LtE : operator.le, ast.Gt : operator.gt,
+            ast.GtE : operator.ge, ast.Eq : operator.eq, ast.NotEq : operator.ne}
+
+def names(expr):
+    '''Set of branch names used in an expression'''
+    return {n.id for n in ast.walk(ast.parse(expr, mode='eval'))
+            if isinstance(n, ast.Name) and n.id not in _functions and n.id not in _constants}
+
+def evaluate(expr, resolve):
+    '''
+    Evaluate an expression over whole columns
+
+    Arguments
+    ---------
+
+    expr     (string)      Expression to evaluate
+    resolve  (callable)    Returns the array for a branch name, only called
+                           for the branches used in the expression
+    '''
+    _cache = {}
+
+    def _eval(node):
+        if isinstance(node, ast.Expression):
+            return _eval(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id in _constants:
+                return _constants[node.id]
+            if node.id not in _cache:
+                _cache[node.id] = resolve(node.id)
+            return _cache[node.id]
+        if isinstance(node, ast.BoolOp):
+            #Fold pairwise rather than stacking so operands of different shapes broadcast
+            return functools.reduce(np.logical_and if isinstance(node.op, ast.And) else np.logical_or,
+                                    [_eval(v) for v in node.values])
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _unary:
+            return _unary[type(node.op)](_eval(node.operand))
+        if isinstance(node, ast.BinOp) and type(node.op) in _binary:
+            return _binary[type(node.op)](_eval(node.left), _eval(node.right))
+        if isinstance(node, ast.Compare) and all(type(op) in _compare for op in node.ops):
+            _left, _result = _eval(node.left), True
+            for op, comparator in zip(node.ops, node.comparators):
+                _right = _eval(comparator)
+                _result = np.logical_and(_result, _compare[type(op)](_left, _right))
+                _left = _right
+            return _result
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _functions \
+                and not node.keywords:
+            return _functions[node.func.id](*[_eval(a) for a in node.args])
+        raise ValueError("Unsupported expression '{}'".format(ast.dump(node)))
+
+    try:
+        _tree = ast.parse(expr, mode='eval')
+    except SyntaxError as e:
+        raise ValueError("Could not parse expression '{}': {}".format(expr, e))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _eval(_tree)
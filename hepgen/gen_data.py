@@ -1,51 +1,215 @@
-from hepgen.decays import decay_table 
-from hepgen.data_tree import data_tree
-from hepgen import __version__
-from pktools.PKLorentzVector import PKLorentzVector
-from scipy.stats import expon, norm
-from random import uniform
+from hepgen import decays
+from hepgen.data_tree import data_tree, tree_writer, threaded_sink
+from hepgen.profiling import RunProfile
+from hepgen import kinematics
+from hepgen.kinematics import LorentzVectorArray
+from hepgen.decay_chain import DecayPlan
+from hepgen.rng import RandomProvider
+from hepgen import phase_space
+import hepgen
 from math import pi, atan, log, tan
+from collections import deque
+import numpy as np
+import contextlib
+import copy
 
 import logging
 logging.basicConfig()
 
-def sq_rt(number):
-    _num = uniform(-1,1)
+_fac = 5.729E-29*1E-12/(1E6*1.911E-43*1E-3) #Conversion of gamma*tau*beta to flight distance
+
+_variables = ['TAU', 'PX', 'THETA', 'PHI', 'P', 'PE', 'PY', 'PZ', 'PT', 'ETA', 'M',
+              'FDX', 'FDY', 'FDZ', 'FD', 'OVX', 'OVY', 'OVZ', 'EVX', 'EVY', 'EVZ']
+
+_chunk_size = 10000 #Default number of events sharing one random number stream
+
+_no_profile = contextlib.nullcontext()
+
+#Columns which are functions of others of the same particle, computed with the
+#same conventions as the per-event generator
+def _column_p(px, py, pz):
+    return LorentzVectorArray(None, px, py, pz).p
+
+def _column_pt(px, py):
+    return LorentzVectorArray(None, px, py, None).pt
+
+def _column_eta(px, py, pz):
+    return kinematics.eta_from_theta(kinematics.theta(px, py, pz))
+
+def _column_m(pe, px, py, pz):
+    return LorentzVectorArray(pe, px, py, pz).m
+
+def _column_fd(fdx, fdy, fdz):
+    return np.sqrt(fdx**2+fdy**2+fdz**2)
+
+def _column_zero(px):
+    return np.zeros_like(px)
+
+_derived = {'P'     : (('PX', 'PY', 'PZ'), _column_p),
+            'PT'    : (('PX', 'PY'), _column_pt),
+            'THETA' : (('PX', 'PY', 'PZ'), kinematics.theta),
+            'PHI'   : (('PX', 'PY'), kinematics.phi),
+            'ETA'   : (('PX', 'PY', 'PZ'), _column_eta),
+            'M'     : (('PE', 'PX', 'PY', 'PZ'), _column_m),
+            'FD'    : (('FDX', 'FDY', 'FDZ'), _column_fd)}
+
+def sq_rt(number, rng=np.random):
+    _num = rng.uniform(-1,1)
     _vec = _num/abs(_num)
     return _vec*pow(number, 0.5)
 
 class HEPGen(object):
-    def __init__(self, decay_id, tree=None, nevts=1, energy=0):
+    def __init__(self, decay_id, tree=None, nevts=1, energy=0, batch_size=None, dtype=float,
+                 seed=None, workers=1, chunk_size=None, profile=None, primary_only=False, chain=False,
+                 mode='uniform', rng=None):
+        '''
+        Monte Carlo generator for a single decay from the DecayTable
+
+        Arguments
+        ---------
+
+        decay_id   (string)     ID of the decay as given in its .dcf file
+
+
+        Optional Arguments
+        ------------------
+
+        tree       (string)     Name of the output Data Tree
+        nevts      (int)        Number of events to generate
+        energy     (float)      Momentum of the mother particle in MeV
+        batch_size (int)        Generate events in NumPy batches of this size,
+                                if None use the per-event reference generator
+        dtype      (numpy dtype)  Type used to store values in the Data Tree
+        seed       (int)        Seed for the random number streams, for a given
+                                seed and chunk size the output is identical
+                                for any number of workers
+        workers    (int)        Number of processes to generate chunks in
+        chunk_size (int)        Number of events per independently seeded chunk,
+                                defaults to 'batch_size' or 10000
+        profile    (bool or RunProfile)  Record stage timings, throughput and
+                                memory use, the summary is stored in the
+                                tree metadata under 'profile'
+        primary_only (bool)     Only store the independent variables, P, PT,
+                                THETA, PHI, ETA, M, FD and the mother origin
+                                vertex are computed when their branches are read
+        chain      (bool or dict)  Decay daughters further with the decays found
+                                for them in the DecayTable, see
+                                hepgen.decay_chain, chains are always generated
+                                in batches
+        mode       (string)     How daughter momenta are sampled, 'uniform' for
+                                successive uniform momentum components with the
+                                last daughter taking the remainder, or
+                                'phase_space' for unweighted N-body phase space
+                                decays, see hepgen.phase_space, which are
+                                always generated in batches
+        rng        (RandomProvider)  Source of the random numbers, each chunk
+                                draws from its own stream spawned from it,
+                                defaults to a RandomProvider seeded with 'seed'
+                                and cannot be given together with 'seed'.
+                                Its settings are stored in the tree metadata
+                                under 'random'
+        '''
         self._logger  = logging.getLogger(__class__.__name__)
         self._logger.setLevel('INFO')
         self._init()
         self._energy  = energy
         self._nevts   = nevts
+        self._chunk_size = chunk_size or batch_size or _chunk_size
+        assert mode in ('uniform', 'phase_space'), "Unknown generation mode '{}'".format(mode)
+        self._mode    = mode
+        self._batch_size = batch_size or (self._chunk_size if chain or mode != 'uniform' else None)
+        self._workers = workers
+        assert rng is None or seed is None, "Give either a seed or a RandomProvider, the provider carries its own seed"
+        self._random  = rng or RandomProvider(seed)
+        self._seed    = self._random.seed
+        self._rng     = None
+        self._dtype   = dtype
+        self._profile = RunProfile() if profile is True else (profile or None)
+        self._primary_only = primary_only
         self._dec     = self._get_decay(decay_id)
+        self._chain   = chain
+        self._plan    = self._compile(chain)
+        self._treename = tree
         self._tree    = self._prepare_tree(tree)
 
+    @property
+    def profile(self):
+        '''The RunProfile of this generator, None if profiling is disabled'''
+        return self._profile
+
+    def _stage(self, name):
+        return self._profile.stage(name) if self._profile else _no_profile
+
+    def _generation(self):
+        return self._profile.generation() if self._profile else _no_profile
+
     def _init(self):
-        self._logger.info("\tRunning {}/v{}".format(__class__.__name__, __version__))
+        self._logger.info("\tRunning {}/v{}".format(__class__.__name__, hepgen.__version__))
 
     def _get_decay(self, decid):
         try:
-            _dec = decay_table(decid)
+            _dec = decays.decay_table(decid)
             assert _dec
             return _dec
         except AssertionError:
             self._logger.error("\tCould not find Decay '{}' in DecayTable".format(decid))
             exit(1)
 
+    def _compile(self, chain):
+        _plan = DecayPlan(self._dec, chain)
+        if chain:
+            self._logger.info("\tDecay chain:\n{}".format(_plan))
+        return _plan
+
     def _prepare_tree(self, treename):
         self._logger.info("\tCreating new data tree '{}'".format(treename))
-        _tree = data_tree('DecayTree_{}'.format(self._dec.ID) if not treename else treename)
-        for var in ['TAU', 'PX', 'THETA', 'PHI', 'P', 'PE', 'PY', 'PZ', 'PT', 'ETA', 'M',
-                    'FDX', 'FDY', 'FDZ', 'FD', 'OVX', 'OVY', 'OVZ', 'EVX', 'EVY', 'EVZ']:
-            _tree.add_branch('{}_{}'.format(self._dec.Mother.name, var))
-            for daughter in self._dec.Daughters:
-                _tree.add_branch('{}_{}'.format(daughter.name, var))
+        return self._build_tree(treename)
+
+    def _build_tree(self, treename, nevts=0):
+        _tree = data_tree('DecayTree_{}'.format(self._dec.ID) if not treename else treename, dtype=self._dtype)
+        _names = dict.fromkeys(self._plan.prefixes())
+        for var in _variables:
+            for name in _names:
+                _tree.add_branch('{}_{}'.format(name, var))
+        #Replace derived branches once all their inputs exist, keeping the branch order
+        for var in _variables:
+            for name in _names:
+                _derived_column = self._derived_column(name, var)
+                if _derived_column:
+                    _tree.add_derived('{}_{}'.format(name, var),
+                                      ['{}_{}'.format(name, v) for v in _derived_column[0]], _derived_column[1])
+        if self._chain:
+            _tree.metadata['decay_chain'] = self._plan.summary()
+        self._record_random(_tree)
+        self._reserve(_tree, nevts)
         return _tree
 
+    def _record_random(self, tree):
+        #Chunk streams are spawned by index and consumed batch by batch in the order
+        #set by the mode, so these are needed to reproduce them
+        tree.metadata['random'] = dict(self._random.state(), chunk_size=self._chunk_size,
+                                       batch_size=self._batch_size, mode=self._mode)
+
+    def _derived_column(self, name, var):
+        '''Inputs and function of a variable which is not stored, None if it is'''
+        if not self._primary_only:
+            return None
+        if var in _derived:
+            return _derived[var]
+        if var in ('OVX', 'OVY', 'OVZ') and self._plan.prefixes().count(name) == 1 and name == self._plan.nodes[0].prefix:
+            return ('PX',), _column_zero #The mother is produced at the origin
+        return None
+
+    def _reserve(self, tree, nevts):
+        _names = self._plan.prefixes()
+        for var in _variables:
+            for name in dict.fromkeys(_names):
+                #Identical particles share a branch so need space for each
+                tree.reserve('{}_{}'.format(name, var), nevts*_names.count(name))
+
+
+    def _label(self):
+        return self._dec.ID
 
     def _pseudorapidity(self, theta):
         try:
@@ -56,30 +220,30 @@ class HEPGen(object):
             return -9999
 
     def _gen_data(self, boosted=0):
+        uniform = self._rng.uniform
+
         p_x = uniform(0, boosted) if boosted != 0 else 0
         p_y = uniform(0, pow(boosted**2-p_x**2, 0.5)) if boosted != 0 else 0
         p_z = pow(boosted**2-p_x**2-p_y**2, 0.5) if boosted != 0 else 0
 
-        P_m = PKLorentzVector(pow(self._dec.Mother.mass**2+p_x**2+p_y**2+p_z**2, 0.5), p_x, p_y, p_z)
-
-        _meas_tau = expon.rvs(scale=self._dec.Mother.lifetime)
+        P_m = LorentzVectorArray(pow(self._dec.Mother.mass**2+p_x**2+p_y**2+p_z**2, 0.5), p_x, p_y, p_z)
 
-        _fac = 5.729E-29*1E-12/(1E6*1.911E-43*1E-3)
+        _meas_tau = self._rng.exponential(self._dec.Mother.lifetime)
 
-        _meas_px = P_m.X[1].value
-        _meas_py = P_m.X[2].value
-        _meas_pz = P_m.X[3].value
+        _meas_px = P_m.px
+        _meas_py = P_m.py
+        _meas_pz = P_m.pz
 
-        _meas_pe = P_m.X[0].value
+        _meas_pe = P_m.e
 
-        _m = P_m.getMagnitude().value
+        _m = P_m.m
+        _m2 = P_m.m2
 
         _ov = (0,0,0) #Set origin vertex of mother to (0,0,0)
 
-        _gamma = _meas_pe/_m
-        _dx  = _gamma*_meas_tau*(_meas_px/_m)*_fac
-        _dy  = _gamma*_meas_tau*(_meas_py/_m)*_fac
-        _dz  = _gamma*_meas_tau*(_meas_pz/_m)*_fac
+        _dx  = _meas_pe*_meas_tau*_meas_px*_fac/_m2
+        _dy  = _meas_pe*_meas_tau*_meas_py*_fac/_m2
+        _dz  = _meas_pe*_meas_tau*_meas_pz*_fac/_m2
 
         _evx  = _ov[0]+_dx
         _evy  = _ov[0]+_dy
@@ -126,18 +290,18 @@ class HEPGen(object):
         self._tree._fill_branch('{}_ETA'.format(self._dec.Mother.name), self._pseudorapidity(_M_theta))
         self._tree._fill_branch('{}_PHI'.format(self._dec.Mother.name), _M_phi)
 
-        _D0 = PKLorentzVector(pow(self._dec.Daughters[0].mass**2+p_x_sq+p_y_sq+p_z_sq, 0.5), sq_rt(p_x_sq), sq_rt(p_y_sq), sq_rt(p_z_sq)) #First Daughter can take any values from the range
-        _meas_px = _D0.X[1].value
-        _meas_py = _D0.X[2].value
-        _meas_tau = expon.rvs(scale=self._dec.Daughters[0].lifetime)
-        _meas_pz = _D0.X[3].value
-        _meas_pe = _D0.X[0].value
-        _m = _D0.getMagnitude().value
+        _D0 = LorentzVectorArray(pow(self._dec.Daughters[0].mass**2+p_x_sq+p_y_sq+p_z_sq, 0.5), sq_rt(p_x_sq, self._rng), sq_rt(p_y_sq, self._rng), sq_rt(p_z_sq, self._rng)) #First Daughter can take any values from the range
+        _meas_px = _D0.px
+        _meas_py = _D0.py
+        _meas_tau = self._rng.exponential(self._dec.Daughters[0].lifetime)
+        _meas_pz = _D0.pz
+        _meas_pe = _D0.e
+        _m = _D0.m
+        _m2 = _D0.m2
 
-        _gamma = _meas_pe/_m
-        _dx  = _gamma*_meas_tau*(_meas_px/_m)*_fac
-        _dy  = _gamma*_meas_tau*(_meas_py/_m)*_fac
-        _dz  = _gamma*_meas_tau*(_meas_pz/_m)*_fac
+        _dx  = _meas_pe*_meas_tau*_meas_px*_fac/_m2
+        _dy  = _meas_pe*_meas_tau*_meas_py*_fac/_m2
+        _dz  = _meas_pe*_meas_tau*_meas_pz*_fac/_m2
 
         _evx_d0 = _evx+_dx
         _evy_d0 = _evy+_dy
@@ -186,18 +350,18 @@ class HEPGen(object):
             p_y_sq = uniform(0, tot_p_y_sq)
             p_z_sq = uniform(0, tot_p_z_sq) 
 
-            _D = PKLorentzVector(pow(self._dec.Daughters[counter].mass**2+p_x_sq+p_y_sq+p_z_sq, 0.5),
-                                    sq_rt(p_x_sq), sq_rt(p_y_sq), sq_rt(p_z_sq))
-            _meas_px = _D.X[1].value
-            _meas_py = _D.X[2].value
-            _meas_pz = _D.X[3].value
-            _meas_tau = expon.rvs(scale=self._dec.Daughters[counter].lifetime)
-            _meas_pe = _D.X[0].value
-            _m = _D.getMagnitude().value
-            _gamma = _meas_pe/_m
-            _dx  = _gamma*_meas_tau*(_meas_px/_m)*_fac
-            _dy  = _gamma*_meas_tau*(_meas_py/_m)*_fac
-            _dz  = _gamma*_meas_tau*(_meas_pz/_m)*_fac
+            _D = LorentzVectorArray(pow(self._dec.Daughters[counter].mass**2+p_x_sq+p_y_sq+p_z_sq, 0.5),
+                                    sq_rt(p_x_sq, self._rng), sq_rt(p_y_sq, self._rng), sq_rt(p_z_sq, self._rng))
+            _meas_px = _D.px
+            _meas_py = _D.py
+            _meas_pz = _D.pz
+            _meas_tau = self._rng.exponential(self._dec.Daughters[counter].lifetime)
+            _meas_pe = _D.e
+            _m = _D.m
+            _m2 = _D.m2
+            _dx  = _meas_pe*_meas_tau*_meas_px*_fac/_m2
+            _dy  = _meas_pe*_meas_tau*_meas_py*_fac/_m2
+            _dz  = _meas_pe*_meas_tau*_meas_pz*_fac/_m2
             _evx_d = _evx+_dx
             _evy_d = _evy+_dy
             _evz_d = _evz+_dz
@@ -234,16 +398,16 @@ class HEPGen(object):
 
             counter += 1
 
-        _meas_px = P_m.X[1].value
-        _meas_py = P_m.X[2].value
-        _meas_pz = P_m.X[3].value
-        _meas_pe = P_m.X[0].value
-        _meas_tau = expon.rvs(scale=self._dec.Daughters[-1].lifetime)
-        _m = P_m.getMagnitude().value
-        _gamma = _meas_pe/_m
-        _dx  = _gamma*_meas_tau*(_meas_px/_m)*_fac
-        _dy  = _gamma*_meas_tau*(_meas_py/_m)*_fac
-        _dz  = _gamma*_meas_tau*(_meas_pz/_m)*_fac
+        _meas_px = P_m.px
+        _meas_py = P_m.py
+        _meas_pz = P_m.pz
+        _meas_pe = P_m.e
+        _meas_tau = self._rng.exponential(self._dec.Daughters[-1].lifetime)
+        _m = P_m.m
+        _m2 = P_m.m2
+        _dx  = _meas_pe*_meas_tau*_meas_px*_fac/_m2
+        _dy  = _meas_pe*_meas_tau*_meas_py*_fac/_m2
+        _dz  = _meas_pe*_meas_tau*_meas_pz*_fac/_m2
         _evx_d = _evx+_dx
         _evy_d = _evy+_dy
         _evz_d = _evz+_dz
@@ -276,10 +440,493 @@ class HEPGen(object):
         self._tree._fill_branch('{}_PHI'.format(self._dec.Daughters[-1].name), _D_phi)
   
 
-    def __call__(self):
-        self._logger.info("\tWill generate {} Events of type '{}'".format(self._nevts, self._dec.ID))
+    def _sign(self, n):
+        return np.where(self._rng.random(n) < 0.5, -1., 1.)
+
+    def _batch_columns(self, P, tau, ov):
+        '''
+        Compute the stored tree variables for one particle over a batch of events
+
+        Arguments
+        ---------
+
+        P    (LorentzVectorArray)   Four-momenta of the particle
+        tau  (numpy array)          Measured lifetimes
+        ov   (tuple of arrays)      Origin vertex (x, y, z)
+        '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _d  = P.e*tau*_fac/P.m2
+            _dx, _dy, _dz = _d*P.px, _d*P.py, _d*P.pz
+
+        _ov = [np.broadcast_to(np.asarray(v, dtype=float), P.e.shape) for v in ov]
+
+        _columns = {'TAU'   : tau,
+                    'PX'    : P.px,
+                    'PE'    : P.e,
+                    'PY'    : P.py,
+                    'PZ'    : P.pz,
+                    'FDX'   : _dx,
+                    'FDY'   : _dy,
+                    'FDZ'   : _dz,
+                    'OVX'   : _ov[0],
+                    'OVY'   : _ov[1],
+                    'OVZ'   : _ov[2],
+                    'EVX'   : _ov[0]+_dx,
+                    'EVY'   : _ov[1]+_dy,
+                    'EVZ'   : _ov[2]+_dz}
+        if not self._primary_only:
+            _theta = kinematics.theta(P.px, P.py, P.pz)
+            _columns.update({'THETA' : _theta,
+                             'PHI'   : kinematics.phi(P.px, P.py),
+                             'P'     : P.p,
+                             'PT'    : P.pt,
+                             'ETA'   : kinematics.eta_from_theta(_theta),
+                             'M'     : P.m,
+                             'FD'    : _column_fd(_dx, _dy, _dz)})
+        return _columns
+
+    def _gen_batch(self, nevts, boosted=0):
+        '''
+        Vectorised equivalent of '_gen_data', generating 'nevts' events at once.
+        The same sampling scheme is used so results agree statistically with
+        the per-event generator, except that unphysical remainders for the
+        last daughter give NaN masses rather than complex numbers.
+        '''
+        _rng = self._rng
+        _mother = self._dec.Mother
+
+        with self._stage('mother'):
+            if boosted != 0:
+                p_x = _rng.uniform(0, boosted, nevts)
+                p_y = _rng.uniform(0, np.sqrt(boosted**2-p_x**2))
+                p_z = np.sqrt(np.maximum(boosted**2-p_x**2-p_y**2, 0))
+            else:
+                p_x = p_y = p_z = np.zeros(nevts)
+
+            _P = LorentzVectorArray.from_mass(_mother.mass, p_x, p_y, p_z)
+            _tau = _rng.exponential(_mother.lifetime, nevts)
+
+            _columns = [self._batch_columns(_P, _tau, (0, 0, 0))]+[None]*(len(self._plan.nodes)-1)
+            _momenta = [_P]+[None]*(len(self._plan.nodes)-1)
+
+        with self._stage('daughters'):
+            #Each decay of a level is sampled once for all of its particles in the batch
+            for level in self._plan.levels:
+                for decay, parents in level:
+                    _P = self._join([_momenta[i] for i in parents])
+                    _ev = tuple(self._join([_columns[i][v] for i in parents]) for v in ('EVX', 'EVY', 'EVZ'))
+                    _products = self._gen_batch_daughters(nevts*len(parents), decay, _P, _ev)
+                    for j, parent in enumerate(parents):
+                        _slice = slice(j*nevts, (j+1)*nevts) if len(parents) > 1 else slice(None)
+                        for child, (P, columns) in zip(self._plan.children[parent], _products):
+                            _momenta[child] = P[_slice]
+                            _columns[child] = {v : c[_slice] for v, c in columns.items()}
+
+        with self._stage('fill'):
+            self._fill_batch(_columns)
+
+    @staticmethod
+    def _join(values):
+        if len(values) == 1:
+            return values[0]
+        if isinstance(values[0], LorentzVectorArray):
+            return LorentzVectorArray(*[np.concatenate([getattr(v, c) for v in values]) for c in ('e', 'px', 'py', 'pz')])
+        return np.concatenate(values)
+
+    def _gen_batch_daughters(self, nevts, decay, p_m, ev):
+        '''
+        Sample the daughter kinematics of a decay for a batch of mothers,
+        returning the four-momenta and columns of each daughter
+        '''
+        if self._mode == 'phase_space':
+            return self._gen_phase_space_daughters(nevts, decay, p_m, ev)
+
+        _rng = self._rng
+        _mother = decay.Mother
+        _daughters = decay.Daughters
+        _products = []
+
+        _totE = _mother.mass #Start with mass of the mother as total available energy
+
+        tot_p_x_sq = _rng.uniform(0, _totE**2, nevts)
+        _totE_sq = _totE**2-tot_p_x_sq
+        tot_p_y_sq = _rng.uniform(0, _totE_sq)
+        tot_p_z_sq = np.sqrt(_totE_sq-tot_p_y_sq)
+
+        p_x_sq = _rng.uniform(0, tot_p_x_sq)
+        p_y_sq = _rng.uniform(0, tot_p_y_sq)
+        p_z_sq = _rng.uniform(0, tot_p_z_sq)
+
+        _P_m = p_m[:]
+
+        for counter, daughter in enumerate(_daughters[:-1]):
+            if counter > 0:
+                tot_p_x_sq = tot_p_x_sq-p_x_sq
+                tot_p_y_sq = tot_p_y_sq-p_y_sq
+                tot_p_z_sq = tot_p_z_sq-p_z_sq
+
+                p_x_sq = _rng.uniform(0, tot_p_x_sq)
+                p_y_sq = _rng.uniform(0, tot_p_y_sq)
+                p_z_sq = _rng.uniform(0, tot_p_z_sq)
+
+            _D = LorentzVectorArray(np.sqrt(daughter.mass**2+p_x_sq+p_y_sq+p_z_sq),
+                                    self._sign(nevts)*np.sqrt(p_x_sq),
+                                    self._sign(nevts)*np.sqrt(p_y_sq),
+                                    self._sign(nevts)*np.sqrt(p_z_sq))
+            _tau = _rng.exponential(daughter.lifetime, nevts)
+            _products.append((_D, self._batch_columns(_D, _tau, ev)))
+
+            _P_m -= _D #Remove from remaining 4-momentum
+
+        _tau = _rng.exponential(_daughters[-1].lifetime, nevts)
+        _products.append((_P_m, self._batch_columns(_P_m, _tau, ev)))
+        return _products
+
+    def _gen_phase_space_daughters(self, nevts, decay, p_m, ev):
+        '''Phase space decays in the mother rest frame boosted to the lab frame'''
+        _rest = phase_space.unweighted(decay.Mother.mass, [d.mass for d in decay.Daughters], nevts,
+                                       self._rng, self._batch_size)
+        _boost = p_m.boost_vector()
+        _products = []
+        for daughter, P in zip(decay.Daughters, _rest):
+            _P = P.boost(*_boost)
+            _tau = self._rng.exponential(daughter.lifetime, nevts)
+            _products.append((_P, self._batch_columns(_P, _tau, ev)))
+        return _products
+
+    def _fill_batch(self, columns):
+        '''
+        Fill per-particle batch columns into the tree. Identical particles
+        share a branch and are interleaved event by event, matching the
+        ordering of the per-event generator.
+        '''
+        _names = self._plan.prefixes()
+        for var in _variables:
+            for name in dict.fromkeys(_names):
+                if self._derived_column(name, var):
+                    continue
+                _cols = [c[var] for n, c in zip(_names, columns) if n == name]
+                _vals = _cols[0] if len(_cols) == 1 else np.stack(_cols, axis=1).ravel()
+                self._tree.extend('{}_{}'.format(name, var), _vals)
+
+    def _chunk(self, index, nevts, chunk_size):
+        '''Copy of this generator for one chunk of events with its own random number stream'''
+        _gen = copy.copy(self)
+        _gen._tree = None
+        _gen._nevts = nevts
+        _gen._chunk_size = chunk_size
+        _gen._rng = self._random.spawn(index)
+        _gen._profile = self._profile.spawn() if self._profile else None
+        return _gen
+
+    def _generate(self):
+        if self._batch_size:
+            for i in range(0, self._nevts, self._batch_size):
+                with self._generation():
+                    self._gen_batch(min(self._batch_size, self._nevts-i), self._energy)
+            return self._tree
         for i in range(self._nevts):
             if i % 1000 == 0:
                 self._logger.info("\tGenerating Event {}/{}".format(i, self._nevts)) 
-            self._gen_data(self._energy)
+            with self._generation(), self._stage('event'):
+                self._gen_data(self._energy)
+        return self._tree
+
+    def _chunks(self, chunk_size):
+        for i, start in enumerate(range(0, self._nevts, chunk_size)):
+            yield self._chunk(i, min(chunk_size, self._nevts-start), chunk_size)
+
+    def _run_chunks(self, chunk_size):
+        '''Generate chunk trees in order, keeping at most two chunks per worker in flight'''
+        for _tree, _profile in self._run_chunk_generators(chunk_size):
+            if self._profile:
+                self._profile.merge(_profile)
+            yield _tree
+
+    def _run_chunk_generators(self, chunk_size):
+        if self._workers <= 1:
+            for _gen in self._chunks(chunk_size):
+                yield _gen_chunk(_gen)
+            return
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(self._workers) as pool:
+            _pending = deque()
+            for _gen in self._chunks(chunk_size):
+                _pending.append(pool.submit(_gen_chunk, _gen))
+                if len(_pending) >= 2*self._workers:
+                    yield _pending.popleft().result()
+            while _pending:
+                yield _pending.popleft().result()
+
+    def iter_chunks(self, chunk_size=None):
+        '''
+        Generate the events as a stream of Data Trees so that memory use is
+        bounded by the chunk size rather than by the total number of events
+
+        Optional Arguments
+        ------------------
+
+        chunk_size  (int)      Number of events per yielded Data Tree,
+                               defaults to the generator chunk size
+        '''
+        chunk_size = chunk_size or self._chunk_size
+        self._logger.info("\tWill stream {} Events of type '{}' with seed {}".format(self._nevts, self._label(), self._seed))
+        for i, _tree in enumerate(self._run_chunks(chunk_size)):
+            self._logger.info("\tGenerated Chunk {}/{}".format(i+1, -(-self._nevts//chunk_size)))
+            yield _tree
+
+    def __call__(self, sink=None):
+        '''
+        Generate all events
+
+        Optional Arguments
+        ------------------
+
+        sink  (callable)     Called with each chunk Data Tree as soon as it is
+                             generated, in which case no tree is accumulated
+                             in memory and None is returned
+        '''
+        if self._profile:
+            self._profile.start()
+
+        if sink:
+            for _tree in self.iter_chunks():
+                with self._stage('io'):
+                    sink(_tree)
+            self._finish_profile(None)
+            return None
+
+        self._logger.info("\tWill generate {} Events of type '{}' with seed {}".format(self._nevts, self._label(), self._seed))
+        self._reserve(self._tree, self._nevts)
+
+        if self._workers > 1:
+            for i, _tree in enumerate(self._run_chunks(self._chunk_size)):
+                self._logger.info("\tMerging Chunk {}/{}".format(i+1, -(-self._nevts//self._chunk_size)))
+                with self._stage('merge'):
+                    self._tree.merge(_tree)
+            self._finish_profile(self._tree)
+            return self._tree
+
+        for i, _gen in enumerate(self._chunks(self._chunk_size)):
+            self._logger.info("\tGenerating Chunk {}/{}".format(i+1, -(-self._nevts//self._chunk_size)))
+            _gen._tree = self._tree
+            _gen._generate()
+            if self._profile:
+                self._profile.merge(_gen._profile)
+        self._finish_profile(self._tree)
+        return self._tree
+
+    def write(self, path, compression=None, queue_size=None):
+        '''
+        Generate all events straight to a Data Tree file. Chunks are written,
+        and compressed if requested, by a background thread while the next
+        chunks are generated, so disk time overlaps with generation. Each
+        chunk is written once at its final place in the file.
+
+        Arguments
+        ---------
+
+        path        (string)   Address of the output file
+
+
+        Optional Arguments
+        ------------------
+
+        compression (string)   Compression of the branches, see 'tree_writer'
+        queue_size  (int)      Number of generated chunks allowed to wait for the
+                               writer before generation pauses, defaults to two
+                               per worker
+        '''
+        _writer = tree_writer(path, compression, nevts=self._nevts)
+        with threaded_sink(_writer, queue_size or 2*max(self._workers, 1)) as sink:
+            self(sink=sink)
+            if self._profile:
+                _writer.metadata['profile'] = self._profile.summary()
+
+    def _finish_profile(self, tree):
+        if not self._profile:
+            return
+        self._profile.stop(self._nevts)
+        self._logger.info("\tRun Profile:{}".format(self._profile))
+        if tree is not None:
+            tree.metadata['profile'] = self._profile.summary()
+
+def _gen_chunk(gen):
+    gen._tree = gen._build_tree(gen._treename, gen._nevts)
+    return gen._generate(), gen._profile
+
+class ChannelTrees(dict):
+    def __init__(self, trees=()):
+        '''Data Trees of a Cocktail run keyed by decay ID'''
+        dict.__init__(self, trees)
+        self.metadata = {}
+
+    def merge(self, other):
+        '''Append the entries of each channel of another ChannelTrees'''
+        for _id in other:
+            self[_id].merge(other[_id])
+
+    def getN(self):
+        '''Get Number of Entries in all channels'''
+        return sum(t.getN() or 0 for t in self.values())
+
+class Cocktail(HEPGen):
+    def __init__(self, decay_ids, weights=None, shared=False, tree=None, nevts=1, energy=0, batch_size=None,
+                 dtype=float, seed=None, workers=1, chunk_size=None, profile=None, primary_only=False,
+                 chain=False, mode='uniform', rng=None):
+        '''
+        Monte Carlo generator for a mixture of decays from the DecayTable. The
+        decay of each event is sampled from the branching ratios or the given
+        weights and all channels are generated in one batched run, which can
+        use several workers as for HEPGen.
+
+        Arguments
+        ---------
+
+        decay_ids  (list of strings)   IDs of the decays as given in their .dcf files
+
+
+        Optional Arguments
+        ------------------
+
+        weights    (list of floats)    Relative rate of each decay, defaults to
+                                       the branching ratios
+        shared     (bool)              Fill a single Data Tree with the branches of
+                                       all decays and a 'channel' branch holding
+                                       the index of the decay of each event.
+                                       Branches of particles a decay does not
+                                       have are NaN. Otherwise a ChannelTrees of
+                                       one Data Tree per decay is filled.
+
+        tree, nevts, energy, batch_size, dtype, seed, workers, chunk_size,
+        profile, primary_only, chain, mode and rng are as for HEPGen, events are always
+        generated in batches
+        '''
+        self._weights = weights
+        self._shared = shared
+        self._branch_layout = None
+        HEPGen.__init__(self, decay_ids, tree=tree, nevts=nevts, energy=energy,
+                        batch_size=batch_size or chunk_size or _chunk_size, dtype=dtype, seed=seed,
+                        workers=workers, chunk_size=chunk_size, profile=profile, primary_only=primary_only,
+                        chain=chain, mode=mode, rng=rng)
+
+    def _get_decay(self, decids):
+        return [HEPGen._get_decay(self, d) for d in decids]
+
+    def _label(self):
+        return ', '.join(d.ID for d in self._dec)
+
+    def _compile(self, chain):
+        self._plans = {d.ID : DecayPlan(d, chain) for d in self._dec}
+        if chain:
+            for _id in self._plans:
+                self._logger.info("\tDecay chain of '{}':\n{}".format(_id, self._plans[_id]))
+        return None
+
+    def _probabilities(self):
+        _weights = np.asarray(self._weights if self._weights is not None else [d.BR for d in self._dec], dtype=float)
+        assert len(_weights) == len(self._dec), "Number of Weights must match Number of Decays"
+        assert np.all(_weights >= 0) and _weights.sum() > 0, \
+            "Weights must not be negative, give weights for decays without a known branching ratio"
+        return _weights/_weights.sum()
+
+    def _channel(self, decay):
+        '''Generator of a single decay sharing the settings and random number stream of this one'''
+        _gen = HEPGen.__new__(HEPGen)
+        _gen.__dict__.update(self.__dict__)
+        _gen._dec = decay
+        _gen._plan = self._plans[decay.ID]
+        _gen._tree = None
+        return _gen
+
+    def _particles(self, decay):
+        return self._plans[decay.ID].prefixes()
+
+    def _layout(self):
+        '''
+        Branches of the shared tree as branch -> (particle, variable, values per
+        event, [(channel, values per event of the channel)] for the channels
+        with that particle)
+        '''
+        if self._branch_layout is None:
+            _names = dict.fromkeys(n for d in self._dec for n in self._particles(d))
+            _counts = {name : [(c, self._particles(d).count(name)) for c, d in enumerate(self._dec)
+                               if name in self._particles(d)] for name in _names}
+            self._branch_layout = {'{}_{}'.format(name, var) : (name, var, max(k for _, k in _counts[name]), _counts[name])
+                                   for var in _variables for name in _names}
+        return self._branch_layout
+
+    def _build_tree(self, treename, nevts=0):
+        _p = self._probabilities()
+        if not self._shared:
+            _trees = ChannelTrees()
+            for decay, p in zip(self._dec, _p):
+                _tree = self._channel(decay)._build_tree('{}_{}'.format(treename, decay.ID) if treename else None)
+                _tree.metadata['weight'] = float(p)
+                _trees[decay.ID] = _tree
+            self._reserve(_trees, nevts)
+            return _trees
+
+        _tree = data_tree(treename or 'Cocktail', dtype=self._dtype)
+        _tree.add_branch('channel', dtype=np.int32)
+        for branch in self._layout():
+            _tree.add_branch(branch)
+        for branch, (name, var, _, _) in self._layout().items():
+            if self._primary_only and var in _derived:
+                _tree.add_derived(branch, ['{}_{}'.format(name, v) for v in _derived[var][0]], _derived[var][1])
+        _tree.metadata['channels'] = {d.ID : {'index' : c, 'weight' : float(p), 'decay' : d.Descriptor.strip()}
+                                      for c, (d, p) in enumerate(zip(self._dec, _p))}
+        if self._chain:
+            for d in self._dec:
+                _tree.metadata['channels'][d.ID]['decay_chain'] = self._plans[d.ID].summary()
+        self._record_random(_tree)
+        self._reserve(_tree, nevts)
+        return _tree
+
+    def _reserve(self, tree, nevts):
+        if not self._shared:
+            for decay, p in zip(self._dec, self._probabilities()):
+                #Leave room for fluctuations of the sampled number of events
+                self._channel(decay)._reserve(tree[decay.ID], int(nevts*p+5*np.sqrt(nevts*p)))
+            return
+        tree.reserve('channel', nevts)
+        for branch, (_, _, k, _) in self._layout().items():
+            tree.reserve(branch, nevts*k)
+
+    def _generate(self):
+        _channels = self._rng.choice(len(self._dec), size=self._nevts, p=self._probabilities())
+        _trees = []
+        for c, decay in enumerate(self._dec):
+            _gen = self._channel(decay)
+            _gen._tree = _gen._build_tree(None) if self._shared else self._tree[decay.ID]
+            _count = int(np.count_nonzero(_channels == c))
+            for i in range(0, _count, self._batch_size):
+                with self._generation():
+                    _gen._gen_batch(min(self._batch_size, _count-i), self._energy)
+            _trees.append(_gen._tree)
+        if self._shared:
+            with self._stage('fill'):
+                self._fill_shared(_channels, _trees)
         return self._tree
+
+    def _fill_shared(self, channels, trees):
+        '''Scatter the events of each channel tree into the shared tree in sampled order'''
+        _order = np.argsort(channels, kind='stable')
+        _index = np.split(_order, np.cumsum(np.bincount(channels, minlength=len(self._dec)))[:-1])
+        self._tree.extend('channel', channels)
+        for branch, (name, var, k, counts) in self._layout().items():
+            if self._primary_only and var in _derived:
+                continue
+            _values = np.full((len(channels), k), np.nan)
+            for c, _k in counts:
+                _values[_index[c], :_k] = trees[c].getBranch(branch).reshape(-1, _k)
+            self._tree.extend(branch, _values.ravel())
+
+    def write(self, path, compression=None, queue_size=None):
+        '''
+        Generate all events straight to a Data Tree file, see HEPGen.write.
+        Only a shared tree can be written as a single file.
+        '''
+        assert self._shared, "Only a Cocktail with shared=True can be written to a single file, " \
+            "call it to get the Data Tree of each decay and save them separately"
+        HEPGen.write(self, path, compression, queue_size)
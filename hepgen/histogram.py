@@ -0,0 +1,195 @@
+#============================================================================#
+#                            Histogram Module                                #
+#============================================================================#
+
+import numpy as np
+
+class Histogram(object):
+    def __init__(self, bins=100, range=None, branch=None, weights=None):
+        '''
+        One or two dimensional histogram with fixed bin edges which can be
+        filled incrementally, e.g. chunk by chunk from a streaming HEPGen run,
+        and merged with histograms filled elsewhere such as in other processes
+
+        Optional Arguments
+        ------------------
+
+        bins     (int, array or tuple)    Number of uniform bins or bin edges, a
+                                          pair of these for a 2D histogram
+        range    (tuple)                  (low, high) of uniform bins, a pair of
+                                          these for a 2D histogram
+        branch   (string or tuple)        Branch names or expressions to fill from
+                                          when the histogram is called with a
+                                          Data Tree, so it can be used as a sink
+        weights  (string)                 Branch name or expression of the weights
+        '''
+        #Bin edges are given as arrays or lists, a tuple always means one entry per axis
+        _2d = isinstance(branch, (tuple, list)) or isinstance(bins, tuple) or np.ndim(range) == 2
+        _bins = bins if isinstance(bins, tuple) else (bins, bins)
+        _range = range if np.ndim(range) == 2 else (range, range)
+        if not _2d:
+            _bins, _range = _bins[:1], _range[:1]
+        self.edges = []
+        self._uniform = []
+        for b, r in zip(_bins, _range):
+            assert not isinstance(b, str), \
+                "Bin rules such as '{}' need the values, give bin edges or use data_tree.histogram".format(b)
+            if np.isscalar(b):
+                assert r is not None, "A range is needed for uniform bins"
+                self.edges.append(np.linspace(r[0], r[1], int(b)+1))
+                self._uniform.append(True)
+            else:
+                self.edges.append(np.asarray(b, dtype=float))
+                self._uniform.append(False)
+        self.branch = branch
+        self.weights = weights
+        _shape = tuple(len(e)-1 for e in self.edges)
+        self.counts = np.zeros(_shape)
+        self.sumw2 = np.zeros(_shape)
+        self.underflow = 0.
+        self.overflow = 0.
+        self.entries = 0
+
+    @property
+    def ndim(self):
+        return len(self.edges)
+
+    def fill(self, *values, weights=None):
+        '''
+        Add values to the histogram in one pass
+
+        Arguments
+        ---------
+
+        values   (numpy arrays)    x values, or x and y values for a 2D histogram
+
+
+        Optional Arguments
+        ------------------
+
+        weights  (numpy array)     Weight of each value
+        '''
+        assert len(values) == self.ndim, "Expected {} arrays of values".format(self.ndim)
+        _values = [np.asarray(v, dtype=float).ravel() for v in values]
+        _weights = None if weights is None else np.asarray(weights, dtype=float).ravel()
+
+        _inside = None
+        for v, edges in zip(_values, self.edges):
+            _below, _above = v < edges[0], v > edges[-1]
+            self.underflow += _below.sum() if _weights is None else _weights[_below].sum()
+            self.overflow += _above.sum() if _weights is None else _weights[_above].sum()
+            _in = ~(_below | _above | np.isnan(v))
+            _inside = _in if _inside is None else _inside & _in
+
+        _index = []
+        for v, edges, uniform in zip(_values, self.edges, self._uniform):
+            _n = len(edges)-1
+            _v = v[_inside]
+            if uniform:
+                _idx = ((_v-edges[0])*(_n/(edges[-1]-edges[0]))).astype(np.intp)
+            else:
+                _idx = np.searchsorted(edges, _v, side='right')-1
+            np.minimum(_idx, _n-1, out=_idx) #Upper edge is inclusive, as for numpy.histogram
+            if uniform:
+                #Rounding can put values next to an edge one bin off, check them against the edges as numpy does
+                _idx -= _v < edges[_idx]
+                _idx += (_v >= edges[_idx+1]) & (_idx != _n-1)
+            _index.append(_idx)
+
+        _flat = _index[0] if self.ndim == 1 else np.ravel_multi_index(_index, self.counts.shape)
+        _w = None if _weights is None else _weights[_inside]
+        _counts = np.bincount(_flat, weights=_w, minlength=self.counts.size).reshape(self.counts.shape)
+        self.counts += _counts
+        self.sumw2 += _counts if _w is None else np.bincount(_flat, weights=_w**2, minlength=self.counts.size).reshape(self.counts.shape)
+        self.entries += len(_values[0])
+        return self
+
+    def fill_tree(self, tree, branch=None, weights=None):
+        '''
+        Fill from the branches or expressions of a Data Tree
+
+        Arguments
+        ---------
+
+        tree     (data_tree)         Data Tree to read
+
+
+        Optional Arguments
+        ------------------
+
+        branch   (string or tuple)   Branch names or expressions, defaults to those
+                                     given when the histogram was created
+        weights  (string)            Branch name or expression of the weights
+        '''
+        _branch = branch or self.branch
+        _weights = weights or self.weights
+        _branches = _branch if isinstance(_branch, (tuple, list)) else [_branch]
+        #Per-entry weights are repeated for branches holding several values per entry
+        _values = tree._evaluate_together(list(_branches)+([_weights] if _weights else []))
+        return self.fill(*_values[:len(_branches)], weights=_values[-1] if _weights else None)
+
+    def __call__(self, tree):
+        self.fill_tree(tree)
+
+    def _check_compatible(self, other):
+        assert self.ndim == other.ndim and all(np.array_equal(a, b) for a, b in zip(self.edges, other.edges)), \
+            "Histograms must have the same bin edges"
+
+    def merge(self, other):
+        '''Add the contents of another histogram with the same bins'''
+        self._check_compatible(other)
+        self.counts += other.counts
+        self.sumw2 += other.sumw2
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.entries += other.entries
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        _sum = Histogram.__new__(Histogram)
+        _sum.__dict__.update({k : (v.copy() if isinstance(v, np.ndarray) else v) for k, v in self.__dict__.items()})
+        _sum.edges = [e.copy() for e in self.edges]
+        return _sum.merge(other)
+
+    @property
+    def errors(self):
+        '''Statistical uncertainty of each bin'''
+        return np.sqrt(self.sumw2)
+
+    @property
+    def centers(self):
+        _centers = [(e[1:]+e[:-1])/2. for e in self.edges]
+        return _centers[0] if self.ndim == 1 else _centers
+
+    def mean(self):
+        '''Mean of the binned values, for 1D histograms'''
+        assert self.ndim == 1, "Only defined for 1D histograms"
+        return np.average(self.centers, weights=self.counts) if self.counts.sum() else np.nan
+
+    def __str__(self):
+        return '''
+====================================
+  Histogram : {}
+  Entries   : {}
+  Bins      : {}
+  Underflow : {}
+  Overflow  : {}
+====================================
+'''.format(self.branch, self.entries, 'x'.join(str(n) for n in self.counts.shape),
+           self.underflow, self.overflow)
+
+    def draw(self, *args, show=True, **kwargs):
+        '''Render with matplotlib, which is only imported here'''
+        import matplotlib.pyplot as plt
+        if self.ndim == 1:
+            plt.hist(self.edges[0][:-1], bins=self.edges[0], weights=self.counts, *args, **kwargs)
+        else:
+            plt.pcolormesh(self.edges[0], self.edges[1], self.counts.T, *args, **kwargs)
+        if self.branch:
+            plt.title('A Histogram of {}'.format(self.branch if self.ndim == 1 else ' vs '.join(self.branch[::-1])))
+            plt.xlabel(self.branch if self.ndim == 1 else self.branch[0])
+        if show:
+            plt.show()
@@ -0,0 +1,174 @@
+#============================================================================#
+#                            Kinematics Module                               #
+#============================================================================#
+
+import numpy as np
+import math
+
+#Angles as stored in the THETA, PHI and ETA branches of a Data Tree, following
+#the original per-event generator: theta = atan(pt/pz) and phi = atan(px/py),
+#with _undefined where pz or py is zero
+_undefined = -9999.
+
+def theta(px, py, pz):
+    '''THETA branch convention, atan(pt/pz)'''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(pz != 0, np.arctan(np.sqrt(px**2+py**2)/pz), _undefined)
+
+def phi(px, py):
+    '''PHI branch convention, atan(px/py)'''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(py != 0, np.arctan(px/py), _undefined)
+
+def eta_from_theta(theta):
+    '''ETA branch convention, -log(tan(|theta/2|)) from a THETA value'''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((theta != _undefined) & (theta != 0), -np.log(np.tan(np.abs(theta/2.))), _undefined)
+
+class LorentzVectorArray(object):
+    def __init__(self, e, px, py, pz):
+        '''
+        Four-vectors of many particles stored as one array per component, all
+        operations act on every vector at once. Components may also be plain
+        numbers, in which case results are scalars.
+
+        Arguments
+        ---------
+
+        e, px, py, pz  (numpy arrays or floats)   Energy and momentum components in MeV
+        '''
+        self.e  = e
+        self.px = px
+        self.py = py
+        self.pz = pz
+
+    @classmethod
+    def from_tree(cls, tree, particle):
+        '''
+        Build from the PE, PX, PY and PZ branches of a particle in a Data Tree
+
+        Arguments
+        ---------
+
+        tree      (data_tree)   Data Tree to read
+        particle  (string)      Particle branch prefix, e.g. 'Kplus'
+        '''
+        return cls(*[tree.getBranch('{}_{}'.format(particle, v)) for v in ('PE', 'PX', 'PY', 'PZ')])
+
+    @classmethod
+    def from_mass(cls, m, px, py, pz):
+        '''Build on-shell vectors from a mass and momentum components'''
+        return cls(np.sqrt(m**2+px**2+py**2+pz**2), px, py, pz)
+
+    def __len__(self):
+        return len(self.e)
+
+    def __getitem__(self, index):
+        return LorentzVectorArray(self.e[index], self.px[index], self.py[index], self.pz[index])
+
+    def __add__(self, other):
+        return LorentzVectorArray(self.e+other.e, self.px+other.px, self.py+other.py, self.pz+other.pz)
+
+    def __sub__(self, other):
+        return LorentzVectorArray(self.e-other.e, self.px-other.px, self.py-other.py, self.pz-other.pz)
+
+    def __iadd__(self, other):
+        self.e, self.px, self.py, self.pz = self.e+other.e, self.px+other.px, self.py+other.py, self.pz+other.pz
+        return self
+
+    def __isub__(self, other):
+        self.e, self.px, self.py, self.pz = self.e-other.e, self.px-other.px, self.py-other.py, self.pz-other.pz
+        return self
+
+    def __str__(self):
+        return 'LorentzVectorArray(e={}, px={}, py={}, pz={})'.format(self.e, self.px, self.py, self.pz)
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def m2(self):
+        '''Invariant mass squared, negative for unphysical vectors'''
+        return self.e**2-self.px**2-self.py**2-self.pz**2
+
+    @property
+    def m(self):
+        '''Invariant mass, NaN where the mass squared is negative'''
+        _m2 = self.m2
+        if isinstance(_m2, float): #Avoid the NumPy overhead for single vectors
+            return math.sqrt(_m2) if _m2 >= 0 else float('nan')
+        with np.errstate(invalid='ignore'):
+            return np.sqrt(_m2)
+
+    @property
+    def p2(self):
+        return self.px**2+self.py**2+self.pz**2
+
+    @property
+    def p(self):
+        return self.p2**0.5
+
+    @property
+    def pt(self):
+        return (self.px**2+self.py**2)**0.5
+
+    @property
+    def theta(self):
+        '''Angle as in the THETA branches, see 'theta', use 'polar_angle' for the polar angle'''
+        return theta(self.px, self.py, self.pz)
+
+    @property
+    def phi(self):
+        '''Angle as in the PHI branches, see 'phi', use 'azimuth' for the azimuthal angle'''
+        return phi(self.px, self.py)
+
+    @property
+    def eta(self):
+        '''Value as in the ETA branches, see 'eta_from_theta', use 'pseudorapidity' for the pseudorapidity'''
+        return eta_from_theta(self.theta)
+
+    @property
+    def polar_angle(self):
+        '''Polar angle from the z axis in [0, pi]'''
+        return np.arctan2(self.pt, self.pz)
+
+    @property
+    def azimuth(self):
+        '''Azimuthal angle from the x axis in (-pi, pi]'''
+        return np.arctan2(self.py, self.px)
+
+    @property
+    def pseudorapidity(self):
+        '''Pseudorapidity, infinite along the beam axis'''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.arcsinh(self.pz/self.pt)
+
+    @property
+    def gamma(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.e/self.m
+
+    def boost_vector(self):
+        '''Velocity (px, py, pz)/E of the frame in which these vectors are at rest'''
+        return self.px/self.e, self.py/self.e, self.pz/self.e
+
+    def boost(self, bx, by, bz):
+        '''
+        Lorentz boost by the velocity (bx, by, bz), e.g. from 'boost_vector' to
+        go from a rest frame to the lab frame
+
+        Arguments
+        ---------
+
+        bx, by, bz  (numpy arrays or floats)    Velocity components in units of c
+        '''
+        _b2 = bx**2+by**2+bz**2
+        _gamma = 1./np.sqrt(1.-_b2)
+        _bp = bx*self.px+by*self.py+bz*self.pz
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _g2 = np.where(_b2 > 0, (_gamma-1.)/_b2, 0.)
+        _f = _g2*_bp+_gamma*self.e
+        return LorentzVectorArray(_gamma*(self.e+_bp),
+                                  self.px+_f*bx,
+                                  self.py+_f*by,
+                                  self.pz+_f*bz)
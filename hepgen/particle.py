@@ -1,6 +1,14 @@
 import pypdt
+import copy
 
-_all_particles = list(pypdt.PDT().ids())
+_table = None
+
+def _get_table():
+    '''Load the PDG particle data table once and share it between lookups'''
+    global _table
+    if _table is None:
+        _table = pypdt.PDT()
+    return _table
 
 def convert_name(name):
     _symbols = {')(' : '_', '(' : '_', ')' : '_',
@@ -9,40 +17,87 @@ def convert_name(name):
     for s in _symbols:
         name = name.replace(s, _symbols[s])
     return name
-         
+
+def _anti_name(name):
+    return name.replace('plus', 'minus') if 'plus' in name else name.replace('minus', 'plus')
+
+def _anti_symbol(symbol):
+    return symbol.replace('+', '-') if '+' in symbol else symbol.replace('-', '+')
+
 class particle(object):
+     __slots__ = ('symbol', 'name', 'charge', 'ctau', 'mass', 'lifetime')
+
      def __init__(self, _id):
-          _part = pypdt.get(_id)
+          _part = _get_table()[_id]
           self.symbol   = _part.name
           self.name     = convert_name(_part.name)
           self.charge   = _part.charge
-          self.ctau     = _part.ctau 
+          self.ctau     = _part.ctau
           self.mass     = _part.mass*1000. #MeV
           self.lifetime = _part.get_lifetime()
 
+     def anti(self):
+          '''Return the charge conjugate of this particle'''
+          _anti = copy.copy(self)
+          _anti.symbol = _anti_symbol(self.symbol)
+          _anti.name   = _anti_name(self.name)
+          _anti.charge = self.charge*-1
+          return _anti
+
 class ParticleList(object):
     def __init__(self):
+        '''
+        Table of all particles in the PDG data table and their antiparticles,
+        indexed by name and by symbol. Particles are only created when they are
+        first accessed.
+        '''
         self.__iter_list__ = []
-        for p in _all_particles:
-            _particle = particle(p)
-            setattr(self, _particle.name, particle(p))
-            self.__iter_list__.append(_particle.name)
-            _particle2 = particle(p)
-            _anti = _particle2.name.replace('plus', 'minus') if 'plus' in _particle.name else _particle.name.replace('minus', 'plus')
-            _particle2.symbol = _particle2.symbol.replace('+', '-') if '+' in _particle2.symbol else _particle2.symbol.replace('-', '+')
-            _particle2.charge = _particle2.charge*-1
-            _particle2.name = _anti
-            setattr(self, _anti, _particle2)
-            self.__iter_list__.append(_anti)
+        self._names = {}     #name -> (PDG ID, is antiparticle)
+        self._symbols = {}   #symbol -> name
+        self._particles = {} #name -> particle, filled on first access
+        for p in _get_table().ids():
+            _name = convert_name(_get_table()[p].name)
+            self._names[_name] = (p, False)
+            self.__iter_list__.append(_name)
+            #Neutral particles without a charge in their name are replaced by their conjugate
+            self._names[_anti_name(_name)] = (p, True)
+            self.__iter_list__.append(_anti_name(_name))
+        for name in self.__iter_list__:
+            _id, _is_anti = self._names[name]
+            _symbol = _get_table()[_id].name
+            self._symbols.setdefault(_anti_symbol(_symbol) if _is_anti else _symbol, name)
+
+    def _materialize(self, name):
+        try:
+            return self._particles[name]
+        except KeyError:
+            _id, _is_anti = self._names[name]
+            _particle = particle(_id).anti() if _is_anti else particle(_id)
+            self._particles[name] = _particle
+            return _particle
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._materialize(name)
+        except KeyError:
+            raise AttributeError("Could not retrieve particle {}".format(name))
 
     def __iter__(self):
         for i in self.__iter_list__:
-            yield getattr(self, i)
+            yield self._materialize(i)
 
     def get(self, symb):
-        for p in self:
-            if p.symbol == symb:
-               return p
-        raise AttributeError("Could not retrieve particle {}".format(symb))
+        try:
+            return self._materialize(self._symbols[symb])
+        except KeyError:
+            raise AttributeError("Could not retrieve particle {}".format(symb))
 
-pdg = ParticleList()
+def __getattr__(name):
+    #Build the particle table on first use of 'pdg' rather than at import
+    if name == 'pdg':
+        global pdg
+        pdg = ParticleList()
+        return pdg
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
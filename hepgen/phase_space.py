@@ -0,0 +1,123 @@
+#============================================================================#
+#                            Phase Space Module                              #
+#============================================================================#
+'''
+N-body phase space decays with the Raubold-Lynch (GENBOD) method. The
+decay is built as a sequence of two-body decays of intermediate systems
+whose masses are drawn uniformly, and each event is weighted by the
+product of the two-body momenta. Events are made unweighted by accepting
+them with probability weight/maximum weight, which is done on whole
+arrays of candidates rather than by retrying single events.
+'''
+
+import numpy as np
+
+from hepgen.kinematics import LorentzVectorArray
+
+def _two_body_momentum(m, m1, m2):
+    '''Momentum of the products of a two-body decay of mass m in its rest frame'''
+    with np.errstate(invalid='ignore'):
+        return np.sqrt(np.maximum((m**2-(m1+m2)**2)*(m**2-(m1-m2)**2), 0.))/(2.*m)
+
+def _direction(n, rng):
+    '''Isotropic unit vectors'''
+    _cos = rng.uniform(-1., 1., n)
+    _sin = np.sqrt(1.-_cos**2)
+    _phi = rng.uniform(0., 2.*np.pi, n)
+    return _sin*np.cos(_phi), _sin*np.sin(_phi), _cos
+
+def max_weight(mass, masses):
+    '''Upper bound of the event weights of 'genbod' for a decay'''
+    _masses = np.asarray(masses, dtype=float)
+    _kinetic = mass-_masses.sum()
+    _weight = 1.
+    for i in range(1, len(_masses)):
+        _weight *= _two_body_momentum(_masses[:i+1].sum()+_kinetic, _masses[:i].sum(), _masses[i])
+    return _weight
+
+def genbod(mass, masses, n, rng):
+    '''
+    Weighted phase space decays of a particle at rest
+
+    Arguments
+    ---------
+
+    mass    (float)             Mass of the decaying particle
+    masses  (list of floats)    Masses of the daughters
+    n       (int)               Number of decays
+    rng     (RandomProvider)    Source of the random numbers, see hepgen.rng,
+                                or a numpy Generator
+
+
+    Returns the four-momenta of each daughter as LorentzVectorArrays and the
+    weight of each decay divided by 'max_weight', so between 0 and 1
+    '''
+    _masses = np.asarray(masses, dtype=float)
+    _kinetic = mass-_masses.sum()
+    if _kinetic < 0:
+        raise ValueError("Decay of mass {} to {} is kinematically forbidden".format(mass, list(masses)))
+    _k = len(_masses)
+    assert _k >= 2, "Phase space decays need at least two daughters"
+
+    #Masses of the systems of the first i+1 daughters from ordered uniform numbers
+    _r = np.sort(rng.random((n, _k-2)), axis=1)
+    _system = np.empty((n, _k))
+    _system[:, 0] = _masses[0]
+    _system[:, 1:-1] = np.cumsum(_masses)[1:-1]+_r*_kinetic
+    _system[:, -1] = mass
+
+    _p = [_two_body_momentum(_system[:, i], _system[:, i-1], _masses[i]) for i in range(1, _k)]
+    _weight = np.prod(_p, axis=0)/max_weight(mass, _masses) if _k > 2 else np.ones(n)
+
+    #First two daughters back to back in the rest frame of their system
+    _nx, _ny, _nz = _direction(n, rng)
+    _daughters = [LorentzVectorArray.from_mass(_masses[0], -_p[0]*_nx, -_p[0]*_ny, -_p[0]*_nz),
+                  LorentzVectorArray.from_mass(_masses[1], _p[0]*_nx, _p[0]*_ny, _p[0]*_nz)]
+
+    #Each further daughter recoils against the system of the previous ones
+    for i in range(2, _k):
+        _pi = _p[i-1]
+        _nx, _ny, _nz = _direction(n, rng)
+        _e = np.sqrt(_pi**2+_system[:, i-1]**2)
+        _b = (_pi*_nx/_e, _pi*_ny/_e, _pi*_nz/_e)
+        _daughters = [d.boost(*_b) for d in _daughters]
+        _daughters.append(LorentzVectorArray.from_mass(_masses[i], -_pi*_nx, -_pi*_ny, -_pi*_nz))
+
+    return _daughters, _weight
+
+def unweighted(mass, masses, n, rng, chunk_size=100000):
+    '''
+    Phase space decays of a particle at rest with equal weights, accepting
+    batches of weighted candidates with probability equal to their weight
+
+    Arguments
+    ---------
+
+    mass    (float)             Mass of the decaying particle
+    masses  (list of floats)    Masses of the daughters
+    n       (int)               Number of decays
+    rng     (RandomProvider)    Source of the random numbers, see hepgen.rng,
+                                or a numpy Generator
+
+
+    Optional Arguments
+    ------------------
+
+    chunk_size  (int)           Largest number of candidates drawn at once
+    '''
+    _accepted, _count, _efficiency = [], 0, 1.
+    _tried = _passed = 0
+    while _count < n:
+        #Draw enough candidates for the remaining events at the efficiency seen so far
+        _m = min(chunk_size, int((n-_count)/_efficiency*1.1)+16)
+        _daughters, _weight = genbod(mass, masses, _m, rng)
+        _keep = np.flatnonzero(rng.random(_m) < _weight)[:n-_count]
+        _accepted.append([d[_keep] for d in _daughters])
+        _count += len(_keep)
+        _tried, _passed = _tried+_m, _passed+len(_keep)
+        _efficiency = max(_passed, 1)/_tried
+
+    if len(_accepted) == 1:
+        return _accepted[0]
+    return [LorentzVectorArray(*[np.concatenate([getattr(a[i], c) for a in _accepted]) for c in ('e', 'px', 'py', 'pz')])
+            for i in range(len(masses))]
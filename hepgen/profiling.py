@@ -0,0 +1,141 @@
+#============================================================================#
+#                            Profiling Module                                #
+#============================================================================#
+
+import contextlib
+import json
+import time
+
+try:
+    import resource
+except ImportError: #Not available on Windows
+    resource = None
+
+def _max_rss_mb():
+    '''Memory high-water mark of this process and its finished workers in MB'''
+    if resource is None:
+        return None
+    import sys
+    _unit = 1E6 if sys.platform == 'darwin' else 1E3 #Bytes on macOS, kB elsewhere
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)/_unit
+
+def cprofile_hook(profiler=None):
+    '''
+    Hook enabling a cProfile profiler around each generation call, inspect it
+    afterwards with pstats. Hooks are not sent to worker processes, so use a
+    single worker to profile generation.
+
+    Optional Arguments
+    ------------------
+
+    profiler  (cProfile.Profile)   Profiler to use, a new one if not given
+    '''
+    import cProfile
+    _profiler = profiler or cProfile.Profile()
+
+    @contextlib.contextmanager
+    def _hook():
+        _profiler.enable()
+        try:
+            yield
+        finally:
+            _profiler.disable()
+
+    _hook.profiler = _profiler
+    return _hook
+
+class RunProfile(object):
+    def __init__(self, hooks=None):
+        '''
+        Timing and throughput record of a generation run
+
+        Optional Arguments
+        ------------------
+
+        hooks  (list of callables)   Each returns a context manager entered around
+                                     every '_gen_data' or '_gen_batch' call,
+                                     e.g. to attach a profiler
+        '''
+        self.hooks = list(hooks or [])
+        self._stages = {} #name -> [seconds, calls]
+        self._nevts = 0
+        self._start = None
+        self._wall = 0.
+
+    def __getstate__(self):
+        #Hooks are often closures which cannot be sent to worker processes
+        _state = self.__dict__.copy()
+        _state['hooks'] = []
+        return _state
+
+    def spawn(self):
+        '''Empty profile with the same hooks, for one chunk of a run'''
+        return RunProfile(self.hooks)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        _start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _stage = self._stages.setdefault(name, [0., 0])
+            _stage[0] += time.perf_counter()-_start
+            _stage[1] += 1
+
+    @contextlib.contextmanager
+    def generation(self):
+        with contextlib.ExitStack() as stack:
+            for hook in self.hooks:
+                stack.enter_context(hook())
+            yield
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def stop(self, nevts):
+        self._wall += time.perf_counter()-self._start
+        self._nevts += nevts
+
+    def merge(self, other):
+        '''Add the stage timings of another profile, e.g. from a worker'''
+        for name in other._stages:
+            _stage = self._stages.setdefault(name, [0., 0])
+            _stage[0] += other._stages[name][0]
+            _stage[1] += other._stages[name][1]
+
+    def summary(self):
+        '''Dictionary of run throughput, memory use and time spent per stage'''
+        _total = sum(s[0] for s in self._stages.values()) or 1.
+        return {'nevts'          : self._nevts,
+                'wall_time'      : self._wall,
+                'events_per_sec' : self._nevts/self._wall if self._wall else None,
+                'max_rss_mb'     : _max_rss_mb(),
+                'stages'         : {name : {'time'     : s[0],
+                                            'calls'    : s[1],
+                                            'fraction' : s[0]/_total}
+                                    for name, s in self._stages.items()}}
+
+    def to_json(self, path=None):
+        '''Return the summary as JSON, also writing it to 'path' if given'''
+        _json = json.dumps(self.summary(), indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(_json)
+        return _json
+
+    def __str__(self):
+        _summary = self.summary()
+        _str = '''
+====================================
+  Events      : {}
+  Wall Time   : {:.3f} s
+  Events/sec  : {}
+  Max RSS     : {} MB
+====================================
+'''.format(_summary['nevts'], _summary['wall_time'],
+           '{:.1f}'.format(_summary['events_per_sec']) if _summary['events_per_sec'] else None,
+           '{:.1f}'.format(_summary['max_rss_mb']) if _summary['max_rss_mb'] is not None else None)
+        for name, s in _summary['stages'].items():
+            _str += ' {:<12} {:10.3f} s  {:6.1%}  ({} calls)\n'.format(name, s['time'], s['fraction'], s['calls'])
+        return _str
@@ -0,0 +1,104 @@
+#============================================================================#
+#                            Random Number Module                            #
+#============================================================================#
+'''
+Source of the random numbers of a generator run. Single values, as drawn by
+the per-event generator, are handed out from large buffers of standard
+uniform, exponential and normal numbers which are refilled in one call to
+the numpy Generator, avoiding the per-call overhead of drawing them one at
+a time. Whole arrays, as drawn by the batch engine, are passed straight to
+the numpy Generator, so for a given seed batched output does not depend on
+the buffer size.
+
+Independent streams, e.g. one per chunk of events, are split off with
+'spawn' and are identified by the seed and their spawn key alone, which is
+what is recorded in the tree metadata.
+'''
+
+import numpy as np
+
+_buffer_size = 8192 #Default number of values drawn per refill
+
+class RandomProvider(object):
+    def __init__(self, seed=None, buffer_size=_buffer_size, bit_generator=np.random.PCG64, spawn_key=()):
+        '''
+        Seeded random number stream with buffered single draws
+
+        Optional Arguments
+        ------------------
+
+        seed           (int)            Entropy of the stream, a fresh one if None
+        buffer_size    (int)            Number of values drawn each time a buffer
+                                        of single values runs out
+        bit_generator  (class)          numpy BitGenerator to use
+        spawn_key      (tuple of ints)  Position of this stream among those
+                                        split off from the seed
+        '''
+        assert buffer_size > 0, "Buffer size must be positive"
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.spawn_key = tuple(spawn_key)
+        self.buffer_size = int(buffer_size)
+        self._bit_generator = bit_generator
+        self.generator = np.random.Generator(bit_generator(np.random.SeedSequence(self.seed, spawn_key=self.spawn_key)))
+        self._draws = {'uniform'     : 'random',
+                       'exponential' : 'standard_exponential',
+                       'normal'      : 'standard_normal'}
+        self._buffers = {k : iter(()) for k in self._draws}
+        self.refills = 0
+
+    def spawn(self, index):
+        '''Independent stream number 'index' of this one, with the same settings'''
+        return RandomProvider(self.seed, self.buffer_size, self._bit_generator, self.spawn_key+(index,))
+
+    def _next(self, kind):
+        try:
+            return next(self._buffers[kind])
+        except StopIteration:
+            #Python floats are much cheaper to hand out one at a time than numpy scalars
+            self._buffers[kind] = iter(getattr(self.generator, self._draws[kind])(self.buffer_size).tolist())
+            self.refills += 1
+            return next(self._buffers[kind])
+
+    @staticmethod
+    def _single(size, *args):
+        return size is None and all(np.ndim(a) == 0 for a in args)
+
+    def random(self, size=None):
+        '''Uniform numbers in [0, 1)'''
+        if size is None:
+            return self._next('uniform')
+        return self.generator.random(size)
+
+    def uniform(self, low=0., high=1., size=None):
+        '''Uniform numbers in [low, high)'''
+        if self._single(size, low, high):
+            return low+(high-low)*self._next('uniform')
+        return self.generator.uniform(low, high, size)
+
+    def exponential(self, scale=1., size=None):
+        '''Exponentially distributed numbers with mean 'scale' '''
+        if self._single(size, scale):
+            return scale*self._next('exponential')
+        return self.generator.exponential(scale, size)
+
+    def normal(self, loc=0., scale=1., size=None):
+        '''Normally distributed numbers'''
+        if self._single(size, loc, scale):
+            return loc+scale*self._next('normal')
+        return self.generator.normal(loc, scale, size)
+
+    def choice(self, *args, **kwargs):
+        return self.generator.choice(*args, **kwargs)
+
+    def integers(self, *args, **kwargs):
+        return self.generator.integers(*args, **kwargs)
+
+    def state(self):
+        '''Settings which reproduce this stream, for the tree metadata'''
+        return {'bit_generator' : self._bit_generator.__name__,
+                'seed'          : self.seed,
+                'spawn_key'     : list(self.spawn_key),
+                'buffer_size'   : self.buffer_size}
+
+    def __str__(self):
+        return "RandomProvider({}, seed={}, spawn_key={})".format(self._bit_generator.__name__, self.seed, self.spawn_key)
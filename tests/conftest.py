@@ -0,0 +1,17 @@
+#============================================================================#
+#                            Shared Test Fixtures                            #
+#============================================================================#
+
+import numpy as np
+import pytest
+
+def _assert_same(a, b):
+    assert a.getBranches() == b.getBranches()
+    assert a.getN() == b.getN()
+    for branch in a.getBranches():
+        np.testing.assert_array_equal(a.getBranch(branch), b.getBranch(branch), err_msg=branch)
+
+@pytest.fixture
+def assert_same():
+    '''Check that two Data Trees hold the same branches and values'''
+    return _assert_same
@@ -0,0 +1,227 @@
+#============================================================================#
+#                          Data Tree Behaviour Tests                         #
+#============================================================================#
+
+import logging
+
+import numpy as np
+import pytest
+
+from hepgen.data_tree import data_tree, tree_writer, threaded_sink, merge_files
+from hepgen.gen_data import HEPGen
+
+logging.disable(logging.INFO)
+
+@pytest.fixture(scope='module')
+def tree():
+    _tree = data_tree('tree', ['x', 'y', 'n'])
+    _rng = np.random.default_rng(1)
+    _tree.fill_columns({'x' : _rng.normal(size=1000), 'y' : _rng.normal(size=1000), 'n' : np.arange(1000)})
+    _tree.add_branch('f', _rng.random(1000), dtype=np.float32)
+    return _tree
+
+@pytest.fixture(scope='module')
+def generated():
+    #Two pi+ per entry so the piplus branches hold two values per entry
+    return HEPGen('SK020002', nevts=2000, energy=1000, batch_size=1000, seed=5, primary_only=True)()
+
+def _chunks(tree, n):
+    _bounds = np.linspace(0, tree.getN(), n+1).astype(int)
+    for start, stop in zip(_bounds[:-1], _bounds[1:]):
+        _chunk = data_tree(tree.name, tree.getBranches())
+        _chunk.fill_columns({b : tree.getBranch(b)[start:stop] for b in tree.getBranches()})
+        yield _chunk
+
+def test_fill_and_fill_columns_give_the_same_columns():
+    _rows = data_tree('rows', ['a', 'b'])
+    for i in range(100):
+        _rows.fill([float(i), 2*i])
+    _columns = data_tree('columns', ['a', 'b'])
+    _columns.fill_columns({'a' : np.arange(50.), 'b' : 2*np.arange(50)})
+    _columns.extend('a', np.arange(50., 100.))
+    _columns.extend('b', 2*np.arange(50, 100))
+    assert _rows.getN() == _columns.getN() == 100
+    for branch in ('a', 'b'):
+        np.testing.assert_array_equal(_rows.getBranch(branch), _columns.getBranch(branch))
+
+def test_columns_keep_their_type():
+    _tree = data_tree('tree', ['a'], dtype=np.float32, capacity=10)
+    _tree.fill_columns({'a' : np.arange(20.)})
+    assert _tree.getBranch('a').dtype == np.float32
+    assert _tree.getN() == 20
+
+def test_values_that_do_not_fit_widen_the_column():
+    _tree = data_tree('tree', ['m'])
+    _tree.fill([1.5])
+    _tree.fill([2+1j])
+    assert _tree.getBranch('m').dtype.kind == 'c'
+    np.testing.assert_array_equal(_tree.getBranch('m'), [1.5, 2+1j])
+
+def test_buffered_values_are_typed_when_read():
+    _tree = data_tree('tree', ['a', 'b'])
+    for i in range(10000):
+        _tree.fill([i, float(i)])
+    _tree._fill_branch('a', 2.5)
+    _tree._fill_branch('b', 'x')
+    assert _tree.getN() == 10001
+    assert _tree.getEntry(-1).a == 2.5 and _tree.getEntry(-1).b == 'x'
+    assert _tree.getBranch('a').dtype == np.float64 and _tree.getBranch('b').dtype == object
+    np.testing.assert_array_equal(_tree.getBranch('a')[:-1], np.arange(10000))
+    #Columns of taken entries are only computed once read, including by a flush
+    _taken = _tree.take(np.arange(3))
+    _taken.fill([1j, 'y'])
+    assert list(_taken.getBranch('a')) == [0, 1, 2, 1j]
+
+def test_get_entry_checks_the_index(tree):
+    assert tree.getEntry(-1).n == tree.getEntry(tree.getN()-1).n == tree.getN()-1
+    for i in (tree.getN(), -tree.getN()-1):
+        with pytest.raises(IndexError):
+            tree.getEntry(i)
+    with pytest.raises(IndexError):
+        data_tree('empty', ['a']).getEntry(0)
+
+@pytest.mark.parametrize('compression', [None, 'zlib', 'lzma', 'bz2'])
+def test_save_open_round_trip(tree, tmp_path, assert_same, compression):
+    _path = str(tmp_path/'tree.hgdt')
+    tree.save(_path, compression=compression)
+    _opened = data_tree.open(_path)
+    assert_same(tree, _opened)
+    assert _opened.name == tree.name
+    assert _opened.getBranch('f').dtype == np.float32
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+@pytest.mark.parametrize('nevts', [None, 1000])
+def test_tree_writer_round_trip(tree, tmp_path, assert_same, compression, nevts):
+    _path = str(tmp_path/'tree.hgdt')
+    with tree_writer(_path, compression=compression, nevts=nevts) as writer:
+        for chunk in _chunks(tree, 4):
+            writer(chunk)
+    assert_same(tree, data_tree.open(_path))
+    assert [p.name for p in tmp_path.iterdir()] == ['tree.hgdt']
+
+def test_object_branches_are_not_saved(tmp_path):
+    _tree = data_tree('tree', ['o'], dtype=object)
+    _tree.fill(['a'])
+    with pytest.raises(TypeError):
+        _tree.save(str(tmp_path/'tree.hgdt'))
+
+def test_take_gathers_the_given_entries(tree):
+    _taken = tree.take(np.array([3, 0, 3]))
+    assert _taken.getN() == 3
+    for branch in tree.getBranches():
+        np.testing.assert_array_equal(_taken.getBranch(branch), tree.getBranch(branch)[[3, 0, 3]])
+
+def test_select_matches_the_mask(tree):
+    _mask = (tree.getBranch('x') > 0) & (np.abs(tree.getBranch('y')) < 1)
+    _selected = tree.select('x > 0 and abs(y) < 1')
+    assert _selected.getN() == _mask.sum()
+    np.testing.assert_array_equal(_selected.getBranch('n'), tree.getBranch('n')[_mask])
+    np.testing.assert_array_equal(tree.select(_mask).getBranch('x'), _selected.getBranch('x'))
+
+def test_define_and_rows(tree):
+    _tree = tree.take(np.arange(10))
+    _tree.define('r', 'sqrt(x**2+y**2)')
+    np.testing.assert_allclose(_tree.getBranch('r'), np.hypot(_tree.getBranch('x'), _tree.getBranch('y')))
+    for i, row in enumerate(_tree.rows(['x', 'r'])):
+        assert row.x == _tree.getBranch('x')[i]
+        assert row['r'] == _tree.getBranch('r')[i]
+
+def _sum(a, b):
+    return a+b
+
+def test_derived_branches_are_computed_when_read(tree):
+    _tree = data_tree('tree', ['x', 'y'], cache_size=1)
+    _tree.fill_columns({'x' : tree.getBranch('x'), 'y' : tree.getBranch('y')})
+    _tree.add_derived('s', ['x', 'y'], _sum)
+    _tree.add_derived('t', ['x', 'x'], _sum)
+    assert _tree.getBranches() == ['x', 'y', 's', 't']
+    np.testing.assert_array_equal(_tree.getBranch('s'), tree.getBranch('x')+tree.getBranch('y'))
+    assert _tree.getEntry(5).t == 2*tree.getBranch('x')[5]
+    _tree.fill([1., 2., None, None])
+    assert _tree.getN() == tree.getN()+1
+    assert _tree.getBranch('s')[-1] == 3.
+    assert len(_tree._cache._columns) == 1
+
+def test_threaded_sink_passes_trees_in_order_and_raises_sink_errors(tree):
+    _received = []
+    with threaded_sink(_received.append, maxsize=1) as sink:
+        for chunk in _chunks(tree, 5):
+            sink(chunk)
+    assert [c.getBranch('n')[0] for c in _received] == [0, 200, 400, 600, 800]
+
+    def _failing(tree):
+        raise ValueError
+    with pytest.raises(ValueError):
+        with threaded_sink(_failing) as sink:
+            for chunk in _chunks(tree, 5):
+                sink(chunk)
+
+def test_concat_of_shards_is_the_tree(generated, assert_same):
+    _shards = generated.shard(3)
+    assert sorted(s.getN() for s in _shards) == [666, 667, 667]
+    assert len(_shards[0].getBranch('piplus_PX')) == 2*_shards[0].getN()
+    assert_same(generated, data_tree.concat(_shards))
+
+def test_merge_files_of_mixed_inputs(generated, tmp_path, assert_same):
+    _shards = generated.shard(3)
+    _paths = [str(tmp_path/'{}.hgdt'.format(i)) for i in range(3)]
+    _shards[0].save(_paths[0])
+    _shards[1].save(_paths[1], compression='zlib')
+    with tree_writer(_paths[2], compression='bz2') as writer:
+        writer(_shards[2])
+    merge_files(_paths, str(tmp_path/'merged.hgdt'))
+    assert_same(generated, data_tree.open(str(tmp_path/'merged.hgdt')))
+
+def test_failed_tree_writer_leaves_no_file(tree, tmp_path):
+    with pytest.raises(ValueError):
+        with tree_writer(str(tmp_path/'tree.hgdt'), nevts=tree.getN()) as writer:
+            writer(tree.take(np.arange(10)))
+            raise ValueError
+    assert list(tmp_path.iterdir()) == []
+
+def test_select_with_several_values_per_entry(generated):
+    _eta = generated.getBranch('piplus_ETA').reshape(-1, 2)
+    _mask = (generated.getBranch('Kplus_PT') > 500) & (_eta < 4).all(axis=1)
+    _selected = generated.select('Kplus_PT > 500 and piplus_ETA < 4')
+    assert _selected.getN() == _mask.sum()
+    np.testing.assert_array_equal(_selected.getBranch('piplus_ETA'), _eta[_mask].ravel())
+    assert generated.select('piplus_ETA < 4', require='any').getN() == (_eta < 4).any(axis=1).sum()
+    assert generated.evaluate('piplus_PT-Kplus_PT').shape == (generated.getN(), 2)
+
+def test_define_and_rows_with_several_values_per_entry(generated):
+    _tree = generated.take(np.arange(10))
+    _tree.define('twice', 'piplus_PT*2')
+    np.testing.assert_allclose(_tree.getBranch('twice'), 2*_tree.getBranch('piplus_PT'))
+    for i, row in enumerate(_tree.rows(['Kplus_PX', 'piplus_PX'])):
+        assert row.Kplus_PX == _tree.getBranch('Kplus_PX')[i]
+        np.testing.assert_array_equal(row.piplus_PX, _tree.getBranch('piplus_PX')[2*i:2*i+2])
+
+def test_take_keeps_all_values_of_each_entry(generated):
+    _taken = generated.take(np.array([3, 0]))
+    np.testing.assert_array_equal(_taken.getBranch('Kplus_PX'), generated.getBranch('Kplus_PX')[[3, 0]])
+    np.testing.assert_array_equal(_taken.getBranch('piplus_PX'), generated.getBranch('piplus_PX')[[6, 7, 0, 1]])
+
+def test_merge_files_refuses_an_output_among_its_inputs(tree, tmp_path):
+    _paths = [str(tmp_path/'{}.hgdt'.format(i)) for i in range(2)]
+    for p in _paths:
+        tree.save(p)
+    with pytest.raises(AssertionError):
+        merge_files(_paths, _paths[1])
+    with pytest.raises(AssertionError):
+        merge_files(_paths, str(tmp_path/'.'/'0.hgdt'))
+    assert data_tree.open(_paths[1]).getN() == tree.getN()
+
+def test_failed_merge_leaves_no_file_and_save_replaces(tree, tmp_path, assert_same):
+    _path = str(tmp_path/'tree.hgdt')
+    tree.save(_path)
+    with open(str(tmp_path/'broken.hgdt'), 'wb') as f:
+        with open(_path, 'rb') as src:
+            f.write(src.read()[:-2000]) #Truncated within the last column
+    with pytest.raises(IOError):
+        merge_files([_path, str(tmp_path/'broken.hgdt')], str(tmp_path/'merged.hgdt'))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['broken.hgdt', 'tree.hgdt']
+
+    #Saving over the file a tree is memory mapped from writes a new file
+    data_tree.open(_path).save(_path)
+    assert_same(tree, data_tree.open(_path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['broken.hgdt', 'tree.hgdt']
@@ -0,0 +1,80 @@
+#============================================================================#
+#                          Decay Table Behaviour Tests                       #
+#============================================================================#
+
+import os
+
+import pytest
+
+from hepgen.decays import DecayList
+
+_record = '''ID: {}
+
+Decay:  K+ -> pi+ pi+ pi-
+Branching Ratio: {}
+
+Description: {}
+'''
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('HEPGEN_CACHE_DIR', str(tmp_path/'cache'))
+    monkeypatch.delenv('HEPGEN_DECAY_PATH', raising=False)
+    return tmp_path/'cache'
+
+def _write(path, decay_id='SK020002', br=0.5, description='Replaced'):
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(_record.format(decay_id, br, description))
+
+def _describe(table):
+    return {d.ID : (d.Descriptor, d.BR, d.Description, d.Mother.name, [p.name for p in d.Daughters]) for d in table}
+
+def test_cached_table_matches_parsed_table(cache_dir):
+    _parsed = _describe(DecayList())
+    assert len(os.listdir(str(cache_dir))) == 1
+    assert _describe(DecayList()) == _parsed
+
+def test_edited_decay_file_invalidates_the_cache(tmp_path):
+    _path = tmp_path/'decays'/'k.dcf'
+    _write(_path, br=0.5)
+    assert DecayList([str(tmp_path/'decays')])('SK020002').BR == 0.5
+    #Same size, so only the modification time shows the file changed
+    _write(_path, br=0.25)
+    os.utime(str(_path), ns=(10**9, 10**9))
+    assert DecayList([str(tmp_path/'decays')])('SK020002').BR == 0.25
+
+def test_added_directories_override_bundled_decays(tmp_path, monkeypatch):
+    _write(tmp_path/'decays'/'k.dcf')
+    _write(tmp_path/'decays'/'new.dcf', decay_id='SK999999', description='New')
+    _table = DecayList()
+    assert _table('SK020002').Description.strip() != 'Replaced'
+    _table.add_directory(str(tmp_path/'decays'))
+    assert _table('SK020002').Description.strip() == 'Replaced'
+    assert _table('SK999999').Description.strip() == 'New'
+    assert _table('SB040006').Descriptor == DecayList()('SB040006').Descriptor
+
+    monkeypatch.setenv('HEPGEN_DECAY_PATH', str(tmp_path/'decays'))
+    assert DecayList()('SK020002').Description.strip() == 'Replaced'
+
+def test_missing_directory_raises(tmp_path, monkeypatch):
+    with pytest.raises(IOError):
+        DecayList().add_directory(str(tmp_path/'missing'))
+    monkeypatch.setenv('HEPGEN_DECAY_PATH', str(tmp_path/'missing'))
+    with pytest.raises(IOError):
+        DecayList()
+
+def _decay_ids(_):
+    return sorted(d.ID for d in DecayList())
+
+def test_concurrent_cache_writers_leave_one_complete_cache(cache_dir):
+    import multiprocessing
+    with multiprocessing.Pool(4) as pool:
+        _ids = pool.map(_decay_ids, range(8))
+    assert all(ids == _ids[0] for ids in _ids)
+    assert len(os.listdir(str(cache_dir))) == 1
+    assert _decay_ids(None) == _ids[0]
+
+def test_unwritable_cache_is_skipped(tmp_path, monkeypatch):
+    (tmp_path/'file').write_text('')
+    monkeypatch.setenv('HEPGEN_CACHE_DIR', str(tmp_path/'file'))
+    assert 'SK020002' in _decay_ids(None)
@@ -0,0 +1,34 @@
+#============================================================================#
+#                          Expression Behaviour Tests                        #
+#============================================================================#
+
+import numpy as np
+import pytest
+
+from hepgen import expression
+
+_columns = {'a' : np.array([1., 2., 3.]), 'b' : np.array([3., 2., 1.])}
+
+def test_arithmetic_comparisons_and_functions():
+    np.testing.assert_allclose(expression.evaluate('sqrt(a**2+b**2)/2', _columns.__getitem__), np.hypot(_columns['a'], _columns['b'])/2)
+    np.testing.assert_array_equal(expression.evaluate('a < b or a == 3', _columns.__getitem__), [True, False, True])
+    np.testing.assert_array_equal(expression.evaluate('not (1 < a <= 2)', _columns.__getitem__), [True, False, True])
+
+def test_only_used_branches_are_resolved():
+    _resolved = []
+    expression.evaluate('a*pi', lambda name: _resolved.append(name) or _columns[name])
+    assert _resolved == ['a']
+    assert expression.names('a+b*sqrt(pi)') == {'a', 'b'}
+
+@pytest.mark.parametrize('expr', ["__import__('os').getcwd()",
+                                  'a.__class__',
+                                  'a.sum()',
+                                  'open("x")',
+                                  'sqrt(a, out=b)',
+                                  '[a for a in b]',
+                                  'lambda: 0',
+                                  '"a"',
+                                  'a +'])
+def test_anything_else_is_rejected(expr):
+    with pytest.raises(ValueError):
+        expression.evaluate(expr, _columns.__getitem__)
@@ -0,0 +1,143 @@
+#============================================================================#
+#                          Generator Behaviour Tests                         #
+#============================================================================#
+
+import logging
+
+import numpy as np
+import pytest
+
+from hepgen.gen_data import HEPGen, Cocktail
+from hepgen.data_tree import data_tree
+from hepgen.rng import RandomProvider
+
+logging.disable(logging.INFO)
+
+_decay = 'SK020002' #K+ -> pi+ pi+ pi-, with two values per entry in the piplus branches
+
+def _generate(**kwargs):
+    _kwargs = dict(nevts=3000, energy=1000, batch_size=500, chunk_size=1000, seed=11)
+    _kwargs.update(kwargs)
+    return HEPGen(_decay, **_kwargs)
+
+@pytest.mark.parametrize('mode', ['uniform', 'phase_space'])
+def test_seed_gives_same_output_for_any_number_of_workers(mode, assert_same):
+    _serial = _generate(mode=mode)()
+    assert_same(_serial, _generate(mode=mode, workers=2)())
+    assert_same(_serial, _generate(mode=mode, workers=3)())
+
+def test_different_seeds_differ():
+    assert not np.array_equal(_generate(seed=1)().getBranch('Kplus_PX'), _generate(seed=2)().getBranch('Kplus_PX'))
+
+def test_per_event_generator_is_reproducible(assert_same):
+    assert_same(_generate(nevts=200, batch_size=None)(), _generate(nevts=200, batch_size=None)())
+
+def _merged(chunks):
+    _tree = chunks[0]
+    for chunk in chunks[1:]:
+        _tree.merge(chunk)
+    return _tree
+
+def test_seed_gives_same_output_streamed(assert_same):
+    _chunks = list(_generate().iter_chunks())
+    assert [c.getN() for c in _chunks] == [1000]*3
+    assert_same(_generate()(), _merged(_chunks))
+
+def test_sink_receives_every_chunk(assert_same):
+    _chunks = []
+    _generate(workers=2)(sink=_chunks.append)
+    assert_same(_generate()(), _merged(_chunks))
+
+def test_primary_only_matches_stored_branches(assert_same):
+    _stored, _derived = _generate()(), _generate(primary_only=True)()
+    assert_same(_stored, _derived)
+    for i in (0, 1234):
+        np.testing.assert_equal(_derived.getEntry(i)._dict, _stored.getEntry(i)._dict)
+
+def _cocktail(**kwargs):
+    _kwargs = dict(weights=[3, 1], nevts=4000, energy=1000, batch_size=500, chunk_size=1000, seed=3)
+    _kwargs.update(kwargs)
+    return Cocktail(['SK020002', 'SB040006'], **_kwargs)
+
+def test_cocktail_samples_channels_by_weight():
+    _trees = _cocktail()()
+    assert _trees.getN() == 4000
+    assert abs(_trees['SK020002'].getN()-3000) < 5*np.sqrt(4000*0.75*0.25)
+    _shared = _cocktail(shared=True)()
+    _channel = _shared.getBranch('channel')
+    assert [np.count_nonzero(_channel == c) for c in (0, 1)] == [_trees['SK020002'].getN(), _trees['SB040006'].getN()]
+    #Particles of the other channel are NaN
+    assert np.isnan(_shared.getBranch('B_c_plus_PX')[_channel == 0]).all()
+    assert not np.isnan(_shared.getBranch('B_c_plus_PX')[_channel == 1]).any()
+
+def test_cocktail_gives_same_output_for_any_number_of_workers(assert_same):
+    _serial, _parallel = _cocktail()(), _cocktail(workers=2)()
+    for decay in _serial:
+        assert_same(_serial[decay], _parallel[decay])
+    assert_same(_cocktail(shared=True)(), _cocktail(shared=True, workers=3)())
+
+def _momentum(tree, prefix, pairs=False):
+    _p = np.stack([tree.getBranch('{}_{}'.format(prefix, v)) for v in ('PE', 'PX', 'PY', 'PZ')])
+    return _p.reshape(4, -1, 2).sum(axis=2) if pairs else _p
+
+def test_decay_chain_conserves_momentum_and_links_vertices():
+    _tree = HEPGen('SB040006', nevts=1000, energy=1000, batch_size=500, chain=True, seed=4)()
+    np.testing.assert_allclose(_momentum(_tree, 'phi_1020_0')+_momentum(_tree, 'Kplus'), _momentum(_tree, 'B_c_plus'),
+                               rtol=1E-9, atol=1E-6)
+    np.testing.assert_allclose(_momentum(_tree, 'Kplus_piplus', pairs=True)+_momentum(_tree, 'Kplus_piminus'),
+                               _momentum(_tree, 'Kplus'), rtol=1E-9, atol=1E-6)
+    for v in 'XYZ':
+        np.testing.assert_array_equal(_tree.getBranch('Kplus_OV'+v), _tree.getBranch('B_c_plus_EV'+v))
+        np.testing.assert_array_equal(_tree.getBranch('Kplus_piplus_OV'+v), np.repeat(_tree.getBranch('Kplus_EV'+v), 2))
+        np.testing.assert_array_equal(_tree.getBranch('Kplus_piminus_OV'+v), _tree.getBranch('Kplus_EV'+v))
+
+def test_chain_override_keeps_particles_stable():
+    _tree = HEPGen('SB040006', nevts=10, energy=1000, batch_size=10, chain={'Kplus' : None}, seed=4)()
+    assert 'Kplus_PX' in _tree.getBranches() and 'Kplus_piplus_PX' not in _tree.getBranches()
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_write_matches_generated_tree(tmp_path, compression, assert_same):
+    _path = str(tmp_path/'out.hgdt')
+    _generate(workers=2).write(_path, compression=compression)
+    assert_same(_generate()(), data_tree.open(_path))
+
+def test_interrupted_write_leaves_no_file(tmp_path):
+    _gen = _generate()
+    _chunk = _gen._chunk
+
+    def _failing_chunk(index, *args):
+        if index == 2:
+            raise KeyboardInterrupt
+        return _chunk(index, *args)
+
+    _gen._chunk = _failing_chunk
+    with pytest.raises(KeyboardInterrupt):
+        _gen.write(str(tmp_path/'out.hgdt'))
+    assert list(tmp_path.iterdir()) == []
+
+def test_shared_cocktail_writes_and_per_channel_refuses(tmp_path, assert_same):
+    _path = str(tmp_path/'cocktail.hgdt')
+    _cocktail(shared=True, workers=2).write(_path)
+    assert_same(_cocktail(shared=True)(), data_tree.open(_path))
+    with pytest.raises(AssertionError):
+        _cocktail().write(str(tmp_path/'channels.hgdt'))
+    assert [p.name for p in tmp_path.iterdir()] == ['cocktail.hgdt']
+
+def test_chain_override_must_decay_that_particle():
+    with pytest.raises(ValueError):
+        HEPGen('SB040006', chain={'phi_1020_0' : 'SK020002'})
+
+def test_random_metadata_reproduces_streamed_run(assert_same):
+    _chunks = list(_generate(batch_size=100).iter_chunks(250))
+    _settings = _chunks[0].metadata['random']
+    assert _settings['chunk_size'] == 250
+    _again = _generate(batch_size=_settings['batch_size'], chunk_size=_settings['chunk_size'],
+                       seed=_settings['seed'], mode=_settings['mode'])()
+    assert_same(data_tree.concat(_chunks), _again)
+
+def test_rng_carries_the_seed(assert_same):
+    assert_same(_generate()(), _generate(seed=None, rng=RandomProvider(11))())
+    with pytest.raises(AssertionError):
+        _generate(rng=RandomProvider(11))
+    with pytest.raises(AssertionError):
+        _cocktail(rng=RandomProvider(3))
@@ -0,0 +1,90 @@
+#============================================================================#
+#                           Histogram Behaviour Tests                        #
+#============================================================================#
+
+import numpy as np
+import pytest
+
+from hepgen.data_tree import data_tree
+from hepgen.histogram import Histogram
+
+@pytest.fixture(scope='module')
+def values():
+    _rng = np.random.default_rng(7)
+    return _rng.normal(0, 2, 5000), _rng.normal(1, 1, 5000), _rng.random(5000)
+
+def test_uniform_and_variable_bins_match_numpy(values):
+    _x = values[0]
+    np.testing.assert_array_equal(Histogram(16, (-4, 4)).fill(_x).counts, np.histogram(_x, 16, (-4, 4))[0])
+    _edges = [-5, -1, 0, 0.5, 2, 6]
+    np.testing.assert_array_equal(Histogram(_edges).fill(_x).counts, np.histogram(_x, _edges)[0])
+
+def test_weighted_fill(values):
+    _x, _, _w = values
+    _hist = Histogram(16, (-4, 4)).fill(_x, weights=_w)
+    np.testing.assert_allclose(_hist.counts, np.histogram(_x, 16, (-4, 4), weights=_w)[0])
+    np.testing.assert_allclose(_hist.errors**2, np.histogram(_x, 16, (-4, 4), weights=_w**2)[0])
+
+def test_two_dimensional_fill(values):
+    _x, _y, _w = values
+    _hist = Histogram((8, 6), ((-4, 4), (-2, 4))).fill(_x, _y, weights=_w)
+    np.testing.assert_allclose(_hist.counts, np.histogram2d(_x, _y, (8, 6), ((-4, 4), (-2, 4)), weights=_w)[0])
+    _hist = Histogram((np.linspace(-4, 4, 9), [-2, 0, 1, 3])).fill(_x, _y)
+    np.testing.assert_array_equal(_hist.counts, np.histogram2d(_x, _y, (np.linspace(-4, 4, 9), [-2, 0, 1, 3]))[0])
+
+def test_underflow_and_overflow(values):
+    _x, _, _w = values
+    _hist = Histogram(10, (-1, 1)).fill(np.append(_x, np.nan), weights=np.append(_w, 1.))
+    assert _hist.underflow == pytest.approx(_w[_x < -1].sum())
+    assert _hist.overflow == pytest.approx(_w[_x > 1].sum())
+    assert _hist.entries == len(_x)+1
+    #The upper edge is inside the last bin, as for numpy.histogram
+    assert Histogram(10, (-1, 1)).fill([1.]).counts[-1] == 1
+
+def test_merged_chunks_equal_one_fill(values):
+    _x, _y, _w = values
+    _whole = Histogram(16, (-4, 4)).fill(_x, weights=_w)
+    _parts = [Histogram(16, (-4, 4)).fill(_x[i::3], weights=_w[i::3]) for i in range(3)]
+    _merged = _parts[0]+_parts[1]
+    _merged += _parts[2]
+    np.testing.assert_allclose(_merged.counts, _whole.counts)
+    np.testing.assert_allclose(_merged.sumw2, _whole.sumw2)
+    assert _merged.entries == _whole.entries
+    assert _parts[0].entries == len(_x[0::3])
+    with pytest.raises(AssertionError):
+        _whole.merge(Histogram(8, (-4, 4)))
+
+def test_tree_histogram_and_sink(values):
+    _tree = data_tree('tree', ['x', 'y'])
+    _tree.fill_columns({'x' : values[0], 'y' : values[1]})
+    np.testing.assert_array_equal(_tree.histogram('x', bins=20).counts, np.histogram(values[0], 20)[0])
+    _sink = Histogram(16, (-4, 4), branch='x-y')
+    _sink(_tree)
+    np.testing.assert_array_equal(_sink.counts, np.histogram(values[0]-values[1], 16, (-4, 4))[0])
+
+def test_per_entry_weights_apply_to_every_value_of_an_entry():
+    _tree = data_tree('tree', ['w'])
+    _tree.fill_columns({'w' : np.array([1., 2., 3.])})
+    _tree.add_branch('x', np.array([0.1, 0.2, 0.3, 0.4, 0.5, 0.6]))
+    _hist = Histogram(3, (0, 0.6)).fill_tree(_tree, 'x', weights='w')
+    np.testing.assert_allclose(_hist.counts, np.histogram(_tree.getBranch('x'), 3, (0, 0.6), weights=[1, 1, 2, 2, 3, 3])[0])
+
+@pytest.mark.parametrize('bins, range', [(30, (0.1, 0.7)), (7, (-1.3, 2.9)), (100, (0., 1E-3))])
+def test_values_on_and_next_to_bin_edges_match_numpy(bins, range):
+    _edges = np.linspace(range[0], range[1], bins+1)
+    _values = np.concatenate([_edges, np.nextafter(_edges, -np.inf), np.nextafter(_edges, np.inf)])
+    np.testing.assert_array_equal(Histogram(bins, range).fill(_values).counts, np.histogram(_values, bins, range)[0])
+
+@pytest.mark.parametrize('bins', ['auto', 'fd', 'sturges'])
+def test_string_bins_are_resolved_from_the_tree(values, bins):
+    _tree = data_tree('tree', ['x', 'y'])
+    _tree.fill_columns({'x' : np.append(values[0][:-1], np.inf), 'y' : values[1]})
+    _finite = _tree.getBranch('x')[:-1]
+    _counts, _edges = np.histogram(_finite, bins)
+    _hist = _tree.histogram('x', bins=bins)
+    np.testing.assert_array_equal(_hist.edges[0], _edges)
+    np.testing.assert_array_equal(_hist.counts, _counts)
+    _hist = _tree.histogram(('x', 'y'), bins=(bins, 10), range=((-4, 4), (-2, 4)))
+    np.testing.assert_array_equal(_hist.edges[0], np.histogram_bin_edges(_finite, bins, (-4, 4)))
+    with pytest.raises(AssertionError):
+        Histogram(bins, (0, 1))
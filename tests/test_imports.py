@@ -0,0 +1,19 @@
+#============================================================================#
+#                           Lazy Import Behaviour Tests                      #
+#============================================================================#
+
+import subprocess
+import sys
+
+def _run(code):
+    return subprocess.check_output([sys.executable, '-c', code]).decode().split()
+
+def test_importing_the_generator_defers_the_tables():
+    _code = ("import sys, hepgen.gen_data, hepgen.particle, hepgen.decays; "
+             "print('pdg' in vars(hepgen.particle), 'decay_table' in vars(hepgen.decays), "
+             "'scipy' in sys.modules, 'concurrent.futures' in sys.modules)")
+    assert _run(_code) == ['False']*4
+
+def test_tables_are_built_on_first_use():
+    _code = "import hepgen.particle; print(hepgen.particle.pdg.piplus.symbol, 'pdg' in vars(hepgen.particle))"
+    assert _run(_code) == ['pi+', 'True']
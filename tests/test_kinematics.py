@@ -0,0 +1,68 @@
+#============================================================================#
+#                          Kinematics Behaviour Tests                        #
+#============================================================================#
+
+import logging
+
+import numpy as np
+
+from hepgen.gen_data import HEPGen
+from hepgen.kinematics import LorentzVectorArray
+
+logging.disable(logging.INFO)
+
+def _vectors(n=1000, m=139.57):
+    _rng = np.random.default_rng(3)
+    return LorentzVectorArray.from_mass(m, *_rng.normal(0, 500, (3, n)))
+
+def test_from_mass_is_on_shell():
+    np.testing.assert_allclose(_vectors().m, 139.57)
+
+def test_boost_round_trip():
+    _vectors_in, _frame = _vectors(), _vectors(m=493.68)
+    _bx, _by, _bz = _frame.boost_vector()
+    _rest = _vectors_in.boost(-_bx, -_by, -_bz)
+    _back = _rest.boost(_bx, _by, _bz)
+    for component in ('e', 'px', 'py', 'pz'):
+        np.testing.assert_allclose(getattr(_back, component), getattr(_vectors_in, component), atol=1E-6)
+    np.testing.assert_allclose(_rest.m, 139.57)
+
+def test_boosting_a_particle_at_rest_gives_the_frame_momentum():
+    _frame = _vectors(m=493.68)
+    _rest = LorentzVectorArray(np.full(len(_frame), 493.68), *np.zeros((3, len(_frame))))
+    _boosted = _rest.boost(*_frame.boost_vector())
+    np.testing.assert_allclose(_boosted.pz, _frame.pz, atol=1E-6)
+    np.testing.assert_allclose(_boosted.e, _frame.e)
+
+def test_single_vectors_match_arrays():
+    _array = _vectors(10)
+    for i in range(10):
+        _single = LorentzVectorArray(*[float(getattr(_array, c)[i]) for c in ('e', 'px', 'py', 'pz')])
+        assert np.isclose(_single.m, _array.m[i])
+        assert np.isclose(_single.eta, _array.eta[i])
+
+def test_unphysical_vectors_have_nan_mass():
+    assert np.isnan(LorentzVectorArray(1., 2., 0., 0.).m)
+    assert np.isnan(LorentzVectorArray(np.array([1.]), np.array([2.]), np.zeros(1), np.zeros(1)).m[0])
+
+def test_sum_of_daughters_is_the_mother():
+    _tree = HEPGen('SK020002', nevts=1000, energy=1000, batch_size=1000, seed=2)()
+    _mother = LorentzVectorArray.from_tree(_tree, 'Kplus')
+    _piplus = LorentzVectorArray.from_tree(_tree, 'piplus')
+    _daughters = _piplus[0::2]+_piplus[1::2]+LorentzVectorArray.from_tree(_tree, 'piminus')
+    np.testing.assert_allclose(_daughters.e, _mother.e, rtol=1E-9)
+    np.testing.assert_allclose(_daughters.pz, _mother.pz, rtol=1E-9, atol=1E-6)
+    np.testing.assert_allclose(_mother.m, 493.677, rtol=1E-6)
+
+def test_angles_match_the_tree_branches():
+    _tree = HEPGen('SK020002', nevts=1000, energy=1000, batch_size=1000, seed=2)()
+    for particle in ('Kplus', 'piplus'):
+        _vectors = LorentzVectorArray.from_tree(_tree, particle)
+        for variable in ('theta', 'phi', 'eta'):
+            np.testing.assert_array_equal(getattr(_vectors, variable), _tree.getBranch('{}_{}'.format(particle, variable.upper())))
+
+def test_usual_angle_conventions():
+    _v = LorentzVectorArray.from_mass(0., np.array([1., 0.]), np.array([0., 1.]), np.array([-1., 1.]))
+    np.testing.assert_allclose(_v.polar_angle, [3*np.pi/4, np.pi/4])
+    np.testing.assert_allclose(_v.azimuth, [0, np.pi/2])
+    np.testing.assert_allclose(_v.pseudorapidity, [-np.arcsinh(1.), np.arcsinh(1.)])
@@ -0,0 +1,53 @@
+#============================================================================#
+#                         Particle Table Behaviour Tests                     #
+#============================================================================#
+
+import pypdt
+import pytest
+
+from hepgen.particle import ParticleList, convert_name
+
+def _describe(p):
+    return (p.symbol, p.name, p.charge, p.ctau, p.mass, p.lifetime)
+
+@pytest.fixture(scope='module')
+def reference():
+    '''Properties of each particle name and their order, built as the eager table did'''
+    _table, _properties, _order = pypdt.PDT(), {}, []
+    for p in _table.ids():
+        _part = _table[p]
+        _name = convert_name(_part.name)
+        _values = (_part.ctau, _part.mass*1000., _part.get_lifetime())
+        _properties[_name] = (_part.name, _name, _part.charge)+_values
+        _order.append(_name)
+        _anti = _name.replace('plus', 'minus') if 'plus' in _name else _name.replace('minus', 'plus')
+        _symbol = _part.name.replace('+', '-') if '+' in _part.name else _part.name.replace('-', '+')
+        _properties[_anti] = (_symbol, _anti, _part.charge*-1)+_values
+        _order.append(_anti)
+    return _properties, _order
+
+@pytest.fixture(scope='module')
+def pdg():
+    return ParticleList()
+
+def test_attribute_lookup_matches_eager_table(pdg, reference):
+    _properties_of, _order = reference
+    for name in _order:
+        assert _describe(getattr(pdg, name)) == _properties_of[name], name
+
+def test_symbol_lookup_returns_first_match(pdg, reference):
+    _properties_of, _order = reference
+    _first = {}
+    for name in _order:
+        _first.setdefault(_properties_of[name][0], _properties_of[name])
+    for symbol in _first:
+        assert _describe(pdg.get(symbol)) == _first[symbol], symbol
+
+def test_iteration_order_is_unchanged(pdg, reference):
+    assert [p.name for p in pdg] == [reference[0][n][1] for n in reference[1]]
+
+def test_unknown_particles_raise(pdg):
+    with pytest.raises(AttributeError):
+        pdg.get('not a particle')
+    with pytest.raises(AttributeError):
+        pdg.not_a_particle
@@ -0,0 +1,46 @@
+#============================================================================#
+#                          Phase Space Behaviour Tests                       #
+#============================================================================#
+
+import logging
+
+import numpy as np
+import pytest
+
+from hepgen import phase_space
+from hepgen.gen_data import HEPGen
+
+logging.disable(logging.INFO)
+
+_kaon, _masses = 493.677, [139.57, 139.57, 139.57]
+
+def _total(daughters):
+    _sum = daughters[0]
+    for d in daughters[1:]:
+        _sum = _sum+d
+    return _sum
+
+@pytest.mark.parametrize('masses', [[139.57, 139.57], _masses, [0.511, 105.66, 0.511, 105.66]])
+def test_genbod_daughters_on_shell_and_momentum_conserved(masses):
+    _daughters, _weight = phase_space.genbod(_kaon, masses, 5000, np.random.default_rng(1))
+    for d, m in zip(_daughters, masses):
+        np.testing.assert_allclose(d.m, m, rtol=1E-6)
+    _sum = _total(_daughters)
+    np.testing.assert_allclose(_sum.e, _kaon, rtol=1E-9)
+    for c in (_sum.px, _sum.py, _sum.pz):
+        np.testing.assert_allclose(c, 0., atol=1E-8)
+    assert np.all((_weight >= 0) & (_weight <= 1))
+
+def test_forbidden_decays_raise():
+    with pytest.raises(ValueError):
+        phase_space.genbod(200., _masses, 10, np.random.default_rng(1))
+
+def test_unweighted_returns_the_requested_decays():
+    _daughters = phase_space.unweighted(_kaon, _masses, 20000, np.random.default_rng(2), chunk_size=5000)
+    assert [len(d) for d in _daughters] == [20000]*3
+    np.testing.assert_allclose(_total(_daughters).e, _kaon, rtol=1E-9)
+
+def test_phase_space_mode_keeps_daughters_on_shell():
+    _tree = HEPGen('SK020002', nevts=2000, energy=1000, batch_size=1000, mode='phase_space', seed=6)()
+    assert not np.isnan(_tree.getBranch('piplus_M')).any()
+    np.testing.assert_allclose(_tree.getBranch('piminus_M'), 139.57, rtol=1E-3)
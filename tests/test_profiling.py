@@ -0,0 +1,67 @@
+#============================================================================#
+#                           Run Profile Behaviour Tests                      #
+#============================================================================#
+
+import contextlib
+import json
+import logging
+
+import pytest
+
+from hepgen.gen_data import HEPGen
+from hepgen.profiling import RunProfile
+
+logging.disable(logging.INFO)
+
+def test_stages_record_time_and_calls():
+    _profile = RunProfile()
+    _profile.start()
+    for _ in range(3):
+        with _profile.stage('a'):
+            pass
+    with _profile.stage('b'):
+        pass
+    _profile.stop(10)
+    _summary = _profile.summary()
+    assert _summary['nevts'] == 10
+    assert {n : s['calls'] for n, s in _summary['stages'].items()} == {'a' : 3, 'b' : 1}
+    assert sum(s['fraction'] for s in _summary['stages'].values()) == pytest.approx(1)
+
+def test_merge_adds_stage_timings():
+    _first, _second = RunProfile(), RunProfile()
+    with _first.stage('a'):
+        pass
+    with _second.stage('a'), _second.stage('b'):
+        pass
+    _first.merge(_second)
+    _stages = _first.summary()['stages']
+    assert _stages['a']['calls'] == 2 and _stages['b']['calls'] == 1
+
+def test_to_json_writes_the_summary(tmp_path):
+    _profile = RunProfile()
+    with _profile.stage('a'):
+        pass
+    _path = str(tmp_path/'profile.json')
+    _json = _profile.to_json(_path)
+    with open(_path) as f:
+        assert json.load(f) == json.loads(_json)
+    assert json.loads(_json)['stages']['a']['calls'] == 1
+
+def test_worker_profiles_are_merged_into_the_run():
+    _kwargs = dict(nevts=2000, energy=1000, batch_size=500, chunk_size=1000, seed=1, profile=True)
+    _serial = HEPGen('SK020002', **_kwargs)().metadata['profile']
+    _parallel = HEPGen('SK020002', workers=2, **_kwargs)().metadata['profile']
+    assert _serial['nevts'] == _parallel['nevts'] == 2000
+    for stage in ('mother', 'daughters', 'fill'):
+        assert _parallel['stages'][stage]['calls'] == _serial['stages'][stage]['calls'] == 4
+
+def test_hooks_wrap_each_generation_call():
+    _calls = []
+
+    @contextlib.contextmanager
+    def _hook():
+        _calls.append(1)
+        yield
+
+    HEPGen('SK020002', nevts=1000, energy=1000, batch_size=250, seed=1, profile=RunProfile([_hook]))()
+    assert len(_calls) == 4
@@ -0,0 +1,32 @@
+#============================================================================#
+#                        Random Provider Behaviour Tests                     #
+#============================================================================#
+
+import numpy as np
+
+from hepgen.rng import RandomProvider
+
+def test_same_seed_and_spawn_key_give_the_same_stream():
+    _a, _b = RandomProvider(5, buffer_size=7), RandomProvider(5, buffer_size=7)
+    assert [_a.uniform(1., 2.) for _ in range(20)] == [_b.uniform(1., 2.) for _ in range(20)]
+    np.testing.assert_array_equal(_a.spawn(3).normal(size=10), _b.spawn(3).normal(size=10))
+    assert not np.array_equal(_a.spawn(3).random(10), _a.spawn(4).random(10))
+
+def test_array_draws_do_not_depend_on_the_buffer_size():
+    _a, _b = RandomProvider(5, buffer_size=16), RandomProvider(5, buffer_size=4096)
+    for method in ('random', 'exponential', 'normal'):
+        np.testing.assert_array_equal(getattr(_a, method)(size=100), getattr(_b, method)(size=100))
+
+def test_single_draws_come_from_the_standard_variates():
+    _provider = RandomProvider(9, buffer_size=8)
+    _expected = np.random.Generator(np.random.PCG64(np.random.SeedSequence(9))).standard_exponential(8)
+    np.testing.assert_allclose([_provider.exponential(2.) for _ in range(8)], 2*_expected)
+    _provider.exponential()
+    assert _provider.refills == 2
+
+def test_state_reproduces_the_stream():
+    _spawned = RandomProvider(11).spawn(2)
+    _state = _spawned.state()
+    _again = RandomProvider(_state['seed'], _state['buffer_size'], getattr(np.random, _state['bit_generator']),
+                            _state['spawn_key'])
+    np.testing.assert_array_equal(_spawned.random(10), _again.random(10))